@@ -0,0 +1,221 @@
+"""Fencing Performance Test のベンチマーク
+
+合成したCMJ/IMTPワークブックを使い、読み込み・集計・描画の各段階の処理時間と
+ピークメモリを計測してJSONに出力する（オフラインで実行可能）。
+
+    python benchmark_performance.py --athletes 30 --sessions 40 --trials 3 -o bench.json
+    python benchmark_performance.py --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import openpyxl
+
+import fencing_performance_app as app
+import fencing_pipeline as pipeline
+
+BENCHMARK_VERSION = 1
+BENCHMARK_TEST_TYPES = ['CMJ', 'IMTP']
+MISSING_VALUE_RATE = 0.03
+
+def generate_workbook(athletes, sessions, trials, seed=0):
+    """選手×セッション×試技の合成ワークブック（CMJ/IMTPシート）をバイト列で作成"""
+    rng = np.random.default_rng(seed)
+    config = pipeline.get_test_config()
+    start = datetime(2023, 1, 2)
+    
+    # 書き込み専用モードで行を順次追加
+    wb = openpyxl.Workbook(write_only=True)
+    for test_type in BENCHMARK_TEST_TYPES:
+        metrics = config[test_type]['metrics']
+        ws = wb.create_sheet(config[test_type]['sheet'])
+        ws.append(['Name', 'Date'] + metrics)
+        
+        # メトリクスごとの基準値と選手ごとの水準
+        scales = 10 ** rng.uniform(0, 3, size=len(metrics))
+        levels = rng.normal(1.0, 0.15, size=(athletes, len(metrics)))
+        for athlete in range(athletes):
+            for session in range(sessions):
+                date = start + timedelta(days=7 * session + athlete % 5)
+                values = scales * levels[athlete] * rng.normal(1.0, 0.05, size=(trials, len(metrics)))
+                missing = rng.random(values.shape) < MISSING_VALUE_RATE
+                for trial_values, trial_missing in zip(values.round(3), missing):
+                    cells = [None if m else float(v) for v, m in zip(trial_values, trial_missing)]
+                    ws.append([f"Athlete {athlete:03d}", date] + cells)
+    
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def measure(func, repeat):
+    """処理時間（repeat回）とピークメモリ（tracemallocで1回）を計測し、最後の結果とともに返す"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    
+    # メモリ計測は時間計測とは別に実行（トレースによる遅延を含めない）
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    stats = {
+        'runs': repeat,
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'peak_memory_mb': peak / 1e6
+    }
+    return stats, result
+
+def run_benchmarks(content, repeat=3, pdf_count=1):
+    """各段階を順に計測（前段の結果を次段の入力に使用）"""
+    config = pipeline.get_test_config()
+    files = [('benchmark.xlsx', content)]
+    stages = {}
+    
+    def stage(name, func):
+        stages[name], result = measure(func, repeat)
+        print(f"{name:<22} {stages[name]['seconds_median'] * 1000:>10.1f} ms  "
+              f"{stages[name]['peak_memory_mb']:>8.1f} MB", file=sys.stderr)
+        return result
+    
+    # 読み込み
+    sheets = stage('read_workbook', lambda: pipeline.read_workbook_sheets(content))
+    raw = stage('create_dataframe', lambda: pipeline.create_dataframe_from_dict(sheets))
+    typed, _ = stage('normalize_schema', lambda: pipeline.normalize_schema(raw))
+    df, _ = stage('deduplicate_trials', lambda: pipeline.deduplicate_trials(typed))
+    stage('parse_total', lambda: pipeline.parse_performance_files(files, max_workers=1))
+    
+    # 集計
+    summary = stage('summary_index', lambda: pipeline.build_summary_index(df, config))
+    trends = stage('trend_index', lambda: pipeline.build_trend_index(df, config))
+    athletes = sorted(df['Name'].unique())
+    
+    def comparison_tables():
+        return [
+            pipeline.create_comparison_table(summary, name, config[test_type]['metrics'], test_type, config, trends)
+            for name in athletes for test_type in BENCHMARK_TEST_TYPES
+            if (name, test_type) in summary['athlete_types']
+        ]
+    
+    stage('comparison_tables', comparison_tables)
+    stage('roster_table', lambda: pipeline.build_roster_table(summary, config))
+    stage('percentile_history', lambda: pipeline.add_percentile_columns(df, summary))
+    stage('aggregate_cube', lambda: pipeline.build_aggregate_cube(df))
+    stage('team_statistics', lambda: pipeline.compute_team_statistics(df, config, summary['cube']))
+    
+    # 描画
+    if app.PLOTLY_AVAILABLE:
+        series = stage('athlete_series', lambda: app.split_athlete_series(df, config))
+        stage('team_chart', lambda: [
+            app.create_team_comparison_chart(df, athletes[:10], test_type, config, series[test_type], trends)
+            for test_type in BENCHMARK_TEST_TYPES
+        ])
+    
+    if pdf_count:
+        stage('pdf_report', lambda: [
+            pipeline.generate_pdf_report(df[df['Name'] == name], df, name, summary)
+            for name in athletes[:pdf_count]
+        ])
+    
+    dataset = {
+        'file_bytes': len(content),
+        'raw_rows': len(raw),
+        'rows': len(df),
+        'athletes': len(athletes),
+        'memory_mb': df.memory_usage(deep=True).sum() / 1e6
+    }
+    return stages, dataset
+
+def environment_info():
+    """比較時に参照する実行環境の情報"""
+    import matplotlib
+    import pandas as pd
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl.__version__,
+        'matplotlib': matplotlib.__version__,
+        'plotly': app.PLOTLY_AVAILABLE
+    }
+
+def compare_with_baseline(result, baseline):
+    """基準結果との比（中央値）を段階ごとに表示し、最大の比を返す"""
+    worst = 0.0
+    print(f"{'stage':<22} {'baseline':>10} {'current':>10} {'ratio':>7}", file=sys.stderr)
+    for name, stats in result['stages'].items():
+        reference = baseline.get('stages', {}).get(name)
+        if reference is None:
+            print(f"{name:<22} {'-':>10} {stats['seconds_median'] * 1000:>8.1f}ms", file=sys.stderr)
+            continue
+        ratio = stats['seconds_median'] / reference['seconds_median'] if reference['seconds_median'] else float('inf')
+        worst = max(worst, ratio)
+        print(f"{name:<22} {reference['seconds_median'] * 1000:>8.1f}ms {stats['seconds_median'] * 1000:>8.1f}ms {ratio:>6.2f}x", file=sys.stderr)
+    return worst
+
+def main(argv=None):
+    """コマンドラインからベンチマークを実行"""
+    parser = argparse.ArgumentParser(description="Benchmark the Fencing Performance Test load, aggregate and render paths.")
+    parser.add_argument('--athletes', type=int, default=20, help="Athletes in the synthetic workbook (default: 20)")
+    parser.add_argument('--sessions', type=int, default=30, help="Sessions per athlete (default: 30)")
+    parser.add_argument('--trials', type=int, default=3, help="Trials per session (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the synthetic data (default: 0)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage (default: 3)")
+    parser.add_argument('--pdf-count', type=int, default=1, help="Athletes to render PDF reports for (default: 1)")
+    parser.add_argument('--workbook', help="Benchmark this workbook instead of a synthetic one")
+    parser.add_argument('-o', '--output', help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument('--baseline', help="Compare against a previous JSON result")
+    parser.add_argument('--fail-above', type=float, default=None,
+                        help="Exit with status 1 if any stage is slower than the baseline by this ratio")
+    args = parser.parse_args(argv)
+    
+    if args.workbook:
+        with open(args.workbook, 'rb') as f:
+            content = f.read()
+    else:
+        content = generate_workbook(args.athletes, args.sessions, args.trials, args.seed)
+    
+    stages, dataset = run_benchmarks(content, repeat=args.repeat, pdf_count=args.pdf_count)
+    result = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'parameters': {key: getattr(args, key) for key in ('athletes', 'sessions', 'trials', 'seed', 'repeat', 'pdf_count', 'workbook')},
+        'dataset': dataset,
+        'stages': stages
+    }
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(result, indent=2))
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            worst = compare_with_baseline(result, json.load(f))
+        if args.fail_above is not None and worst > args.fail_above:
+            print(f"Slowest stage is {worst:.2f}x the baseline (limit {args.fail_above:.2f}x)", file=sys.stderr)
+            return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
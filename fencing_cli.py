@@ -0,0 +1,174 @@
+"""Fencing Performance Test のコマンドライン実行
+
+Streamlitを起動せずにワークブックからレポート・比較表・チーム統計・規準スコア・パーセンタイルを出力する。
+
+    python fencing_cli.py data.xlsx -o reports
+"""
+import pandas as pd
+import warnings
+warnings.filterwarnings('ignore')
+import argparse
+import os
+import sys
+import zipfile
+from io import BytesIO
+
+from fencing_pipeline import (
+    DATA_SHEETS,
+    REPORT_DEFAULT_PROFILE,
+    REPORT_FORMATS,
+    REPORT_MAX_DPI,
+    REPORT_OUTPUT_PROFILES,
+    REPORT_RASTER_DPI,
+    add_norm_score_columns,
+    add_percentile_columns,
+    build_roster_table,
+    build_summary_index,
+    build_trend_index,
+    compute_team_statistics,
+    create_comparison_table,
+    format_batch_report_stats,
+    format_coercion_failures,
+    format_cross_file_sessions,
+    generate_batch_reports,
+    get_test_config,
+    load_dataset,
+    perf_to_chrome_trace,
+    perf_to_json,
+    roster_table_csv,
+    start_perf_recording,
+    stop_perf_recording,
+)
+
+def run_cli(argv=None):
+    """Streamlitを起動せずにレポート・比較表・チーム統計・規準スコア・パーセンタイルを出力するコマンドライン実行"""
+    parser = argparse.ArgumentParser(
+        description="Export Fencing Performance Test reports and statistics without starting Streamlit."
+    )
+    parser.add_argument('workbooks', nargs='+', help=f"Excel files with any of the sheets {list(DATA_SHEETS)} (merged into one dataset)")
+    parser.add_argument('-o', '--output-dir', default='reports', help="Directory to write outputs to (default: reports)")
+    parser.add_argument('-a', '--athletes', nargs='+', help="Only export these athletes (default: whole roster)")
+    parser.add_argument('--no-pdf', action='store_true', help="Skip individual reports")
+    parser.add_argument('--report-format', choices=list(REPORT_FORMATS), default='pdf', help="Individual report file format (default: pdf)")
+    parser.add_argument('--report-profile', choices=list(REPORT_OUTPUT_PROFILES), default=REPORT_DEFAULT_PROFILE,
+                        help=f"compact embeds TrueType font subsets for smaller files, fast uses Type 3 fonts (default: {REPORT_DEFAULT_PROFILE})")
+    parser.add_argument('--dpi', type=int, default=REPORT_RASTER_DPI,
+                        help=f"Raster resolution for PNG output and embedded images, capped at {REPORT_MAX_DPI} (default: {REPORT_RASTER_DPI})")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes for PDF rendering (default: all cores)")
+    parser.add_argument('--profile', help="Write stage timings and memory usage as JSON to this file")
+    parser.add_argument('--trace', help="Write stage timings as a Chrome trace (chrome://tracing, Perfetto) to this file")
+    args = parser.parse_args(argv)
+    
+    if args.profile or args.trace:
+        start_perf_recording(trace_memory=bool(args.profile))
+    
+    files = []
+    for path in args.workbooks:
+        with open(path, 'rb') as f:
+            files.append((os.path.basename(path), f.read()))
+    
+    df, load_info = load_dataset(files)
+    for message in load_info.get('errors', []):
+        print(message, file=sys.stderr)
+    if df is None or df.empty:
+        print(f"No valid data found in {', '.join(args.workbooks)}", file=sys.stderr)
+        return 1
+    
+    config = get_test_config()
+    summary = build_summary_index(df, config)
+    trends = build_trend_index(df, config)
+    
+    player_names = list(df['Name'].dropna().unique())
+    if args.athletes:
+        missing = [name for name in args.athletes if name not in player_names]
+        if missing:
+            print(f"Athletes not found: {', '.join(missing)}", file=sys.stderr)
+            return 1
+        player_names = args.athletes
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Loaded {len(df)} tests for {len(player_names)} athletes "
+          f"({load_info.get('dropped_trials', 0)} duplicate trials removed)")
+    if load_info.get('coercion_failures'):
+        print(f"Unparseable values set to missing: {format_coercion_failures(load_info['coercion_failures'])}", file=sys.stderr)
+    if load_info.get('cross_file_sessions'):
+        print(format_cross_file_sessions(load_info), file=sys.stderr)
+    
+    # 比較テーブル
+    comparison_tables = []
+    for name in player_names:
+        for test_type, test_config in config.items():
+            if (name, test_type) not in summary['athlete_types']:
+                continue
+            metrics = [m for m in test_config['metrics'] if m in df.columns]
+            table = create_comparison_table(summary, name, metrics, test_type, config, trends)
+            table.insert(0, 'Test', test_type)
+            table.insert(0, 'Athlete', name)
+            comparison_tables.append(table)
+    
+    if comparison_tables:
+        comparison_path = os.path.join(args.output_dir, 'comparison_tables.csv')
+        pd.concat(comparison_tables, ignore_index=True).to_csv(comparison_path, index=False)
+        print(f"Wrote {comparison_path}")
+    
+    # ロースター表（全選手×全メトリクス）
+    roster = build_roster_table(summary, config)
+    roster = roster[roster['Name'].isin(player_names)]
+    roster_path = os.path.join(args.output_dir, 'roster_leaderboard.csv')
+    roster_table_csv(roster, roster_path)
+    print(f"Wrote {roster_path}")
+    
+    # チーム統計
+    team_statistics = []
+    for test_type, stats_df in compute_team_statistics(df, config, summary['cube']).items():
+        if not stats_df.empty:
+            stats_df.insert(0, 'Test', test_type)
+            team_statistics.append(stats_df)
+    
+    if team_statistics:
+        statistics_path = os.path.join(args.output_dir, 'team_statistics.csv')
+        pd.concat(team_statistics, ignore_index=True).to_csv(statistics_path, index=False)
+        print(f"Wrote {statistics_path}")
+    
+    # 全試技の規準値に対するZ・Tスコア
+    metrics = summary['metrics']
+    scores = add_norm_score_columns(df[['Name', 'Type', 'Date'] + metrics], summary['norms']).drop(columns=metrics)
+    scores = scores[scores['Name'].isin(player_names)]
+    scores_path = os.path.join(args.output_dir, 'norm_scores.csv')
+    scores.to_csv(scores_path, index=False)
+    print(f"Wrote {scores_path}")
+    
+    # 全試技のチーム分布に対するパーセンタイル
+    percentiles = add_percentile_columns(df[['Name', 'Type', 'Date'] + metrics], summary).drop(columns=metrics)
+    percentiles = percentiles[percentiles['Name'].isin(player_names)]
+    percentiles_path = os.path.join(args.output_dir, 'percentiles.csv')
+    percentiles.to_csv(percentiles_path, index=False)
+    print(f"Wrote {percentiles_path}")
+    
+    # 個人レポート
+    if not args.no_pdf:
+        def print_progress(completed, total, name):
+            print(f"[{completed}/{total}] {name}")
+        
+        report_stats = {}
+        report_data = generate_batch_reports(df, player_names, output_format='zip', summary=summary,
+                                             max_workers=args.workers, progress_callback=print_progress,
+                                             file_format=args.report_format, dpi=args.dpi, profile=args.report_profile,
+                                             report_stats=report_stats)
+        with zipfile.ZipFile(BytesIO(report_data)) as zf:
+            zf.extractall(args.output_dir)
+        print(f"Wrote {len(player_names)} {args.report_format.upper()} reports to {args.output_dir}")
+        print(format_batch_report_stats(report_stats))
+    
+    # 計測結果
+    recording = stop_perf_recording()
+    for path, export in [(args.profile, perf_to_json), (args.trace, perf_to_chrome_trace)]:
+        if path and recording is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(export(recording))
+            print(f"Wrote {path}")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -4,42 +4,99 @@ import numpy as np
 import warnings
 warnings.filterwarnings('ignore')
 from datetime import datetime
-import openpyxl
-from io import BytesIO
+import functools
+import hashlib
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# レポート生成用ライブラリ
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.backends.backend_pdf import PdfPages
-import seaborn as sns
-import base64
+from fencing_pipeline import (
+    CUBE_ALL_SQUADS,
+    CUBE_PERIODS,
+    CUBE_PERIOD_LABELS,
+    CUBE_SQUAD_COLUMN,
+    DATA_SHEETS,
+    LOWER_IS_BETTER,
+    NORM_SET_LABELS,
+    PYPDF_AVAILABLE,
+    REPORT_FORMATS,
+    REPORT_VERSION,
+    ROSTER_ORIENTED_COLUMNS,
+    TREND_COLUMNS,
+    build_ingest_index,
+    build_roster_table,
+    build_summary_index,
+    build_trend_index,
+    compute_dataset_hash,
+    compute_file_hash,
+    compute_team_statistics,
+    create_comparison_table,
+    cube_squads,
+    cube_trend,
+    format_batch_report_stats,
+    format_coercion_failures,
+    format_cross_file_sessions,
+    format_report_stats,
+    format_value,
+    generate_batch_reports,
+    get_test_config,
+    ingest_incremental,
+    is_norm_set_member,
+    load_dataset,
+    lookup_best_value,
+    lookup_latest_value,
+    lookup_norm_score,
+    lookup_team_mean,
+    perf_span,
+    perf_to_chrome_trace,
+    perf_to_json,
+    perf_traced,
+    pivot_roster_table,
+    read_trials,
+    render_report,
+    report_file_name,
+    roster_table_csv,
+    start_perf_recording,
+    stop_perf_recording,
+    trend_series,
+    z_to_t_score,
+)
 
-# Plotlyが利用可能かチェック
+# Plotlyが利用可能かチェック（利用できない場合はアプリ画面で警告）
 try:
-    import plotly.express as px
     import plotly.graph_objects as go
     from plotly.subplots import make_subplots
     PLOTLY_AVAILABLE = True
 except ImportError:
     PLOTLY_AVAILABLE = False
-    st.warning("Plotly library not found. Graph functionality will be disabled.")
 
-# レポート用の変数設定
-REPORT_METRICS = {
-    'CMJ': ['Jump Height(cm)', 'mRSI', 'Braking RFD'],
-    'IMTP': ['Relative Peak Force (BW)']
-}
+# バックグラウンドでのレポート生成（スレッド数・生成済みPDFのキャッシュ件数・状態確認の間隔）
+REPORT_JOB_WORKERS = 1
+REPORT_CACHE_MAX_ENTRIES = 32
+REPORT_POLL_INTERVAL = 1.0
 
-# ページ設定
-st.set_page_config(
-    page_title="Fencing Performance Test",
-    page_icon="🔲",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# データキャッシュ設定（全セッション共有、LRUで古いものから破棄）
+DATASET_CACHE_MAX_ENTRIES = 8
 
-# カスタムCSS（シックなデザイン）
-st.markdown("""
+# 時系列グラフの描画設定（1系列あたりの最大点数と、WebGL描画に切り替える図全体の点数）
+CHART_MAX_POINTS = 400
+WEBGL_POINT_THRESHOLD = 1500
+
+def configure_page():
+    """ページ設定とカスタムCSSを適用"""
+    st.set_page_config(
+        page_title="Fencing Performance Test",
+        page_icon="🔲",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # カスタムCSS（シックなデザイン）
+    st.markdown("""
 <style>
     .main-header {
         background: linear-gradient(135deg, #2D3748 0%, #1A202C 100%);
@@ -148,610 +205,390 @@ st.markdown("""
         border-left: 4px solid #2D3748;
     }
 </style>
-""", unsafe_allow_html=True)
+    """, unsafe_allow_html=True)
 
-def sheet_to_dataframe(sheet):
-    """シートをDataFrameに変換"""
-    data = []
-    for row in sheet.iter_rows(values_only=True):
-        if any(cell is not None for cell in row):  # 空行をスキップ
-            data.append(list(row))
-    
-    if not data or len(data) < 2:
-        return pd.DataFrame()
-        
-    # ヘッダー行を取得
-    headers = data[0]
-    
-    # データ行を取得
-    rows = data[1:]
-    
-    # DataFrameを作成
-    df_data = {}
-    for i, header in enumerate(headers):
-        if header is not None:
-            column_data = []
-            for row in rows:
-                if i < len(row):
-                    value = row[i]
-                    # 日付列の特別処理
-                    if str(header).lower() == 'date' and value is not None:
-                        try:
-                            # Excelのdatetimeオブジェクトを確実にPythonのdatetimeに変換
-                            if hasattr(value, 'date'):
-                                # すでにdatetimeオブジェクトの場合
-                                column_data.append(pd.Timestamp(value))
-                            elif isinstance(value, (int, float)):
-                                # Excelのシリアル番号の場合
-                                column_data.append(pd.Timestamp('1900-01-01') + pd.Timedelta(days=value-2))
-                            else:
-                                # その他の場合は文字列として解析
-                                column_data.append(pd.to_datetime(str(value)))
-                        except Exception as e:
-                            column_data.append(None)
-                    else:
-                        column_data.append(value)
-                else:
-                    column_data.append(None)
-            df_data[str(header)] = column_data
-    
-    # pandasのDataFrameに変換
-    df = pd.DataFrame(df_data)
-    
-    return df
+# 性能計測（環境変数またはURLの ?debug=perf で有効化、無効時は計測しない）
+PERF_DEBUG_ENV = 'FENCING_PERF_DEBUG'
+PERF_DEBUG_QUERY = ('debug', 'perf')
 
-def load_excel_manually(uploaded_file):
-    """手動でExcelファイルを読み込む"""
-    try:
-        # ファイルをバイト形式で読み込み
-        file_content = uploaded_file.getvalue()
-        
-        # openpyxlでワークブックを開く
-        wb = openpyxl.load_workbook(BytesIO(file_content), data_only=True)
-        
-        # シート名を確認
-        if 'CMJ' not in wb.sheetnames or 'IMTP' not in wb.sheetnames:
-            st.error(f"Required sheets not found. Available sheets: {wb.sheetnames}")
-            return None
-        
-        # 各シートからデータを取得
-        data_dict = {}
-        
-        for sheet_name in ['CMJ', 'IMTP']:
-            sheet = wb[sheet_name]
-            df = sheet_to_dataframe(sheet)
-            df['Type'] = sheet_name
-            data_dict[sheet_name] = df
-        
-        return data_dict
-        
-    except Exception as e:
-        st.error(f"Manual Excel loading error: {str(e)}")
-        return None
+def perf_debug_requested():
+    """性能計測のデバッグ表示が要求されているか（環境変数またはURLのクエリ）"""
+    key, value = PERF_DEBUG_QUERY
+    return os.environ.get(PERF_DEBUG_ENV, '') not in ('', '0') or st.query_params.get(key) == value
 
-def create_dataframe_from_dict(data_dict):
-    """辞書からDataFrameを作成"""
-    try:
-        dfs = []
-        
-        for sheet_name, df in data_dict.items():
-            # 空行を除去
-            df = df.dropna(subset=['Name'])
-            
-            # 日付列を確実にdatetime型に変換
-            if 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            
-            dfs.append(df)
-        
-        if dfs:
-            # 結合
-            combined_df = pd.concat(dfs, ignore_index=True, sort=False)
-            
-            # デバッグ情報：日付の範囲を表示
-            if 'Date' in combined_df.columns:
-                date_range = combined_df['Date'].dropna()
-                if not date_range.empty:
-                    st.success(f"✅ Data loaded! Date range: {date_range.min().strftime('%Y-%m-%d')} to {date_range.max().strftime('%Y-%m-%d')}")
-            
-            return combined_df
-        else:
-            return pd.DataFrame()
-            
-    except Exception as e:
-        st.error(f"DataFrame creation error: {str(e)}")
-        return pd.DataFrame()
+def render_perf_panel(recording):
+    """サイドバーに今回の再実行の計測結果を表示し、JSON・Chromeトレースを出力"""
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### ⏱ Performance Debug")
+    st.sidebar.checkbox("Trace memory allocations (slower)", key='perf_trace_memory')
+    
+    if recording is None:
+        return
+    
+    st.sidebar.metric("Rerun total", f"{recording['total_seconds'] * 1000:.0f} ms")
+    totals = pd.DataFrame([
+        {'Span': name, 'Calls': entry['count'], 'Total (ms)': entry['total_seconds'] * 1000, 'Max (ms)': entry['max_seconds'] * 1000}
+        for name, entry in recording['totals'].items()
+    ])
+    if not totals.empty:
+        st.sidebar.dataframe(totals.round(1), hide_index=True, use_container_width=True)
+    
+    memory = []
+    if recording['peak_traced_mb'] is not None:
+        memory.append(f"Peak traced: {recording['peak_traced_mb']:.1f} MB")
+    if recording['max_rss_mb'] is not None:
+        memory.append(f"Process max RSS: {recording['max_rss_mb']:.0f} MB")
+    if memory:
+        st.sidebar.caption(" / ".join(memory))
+    
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    st.sidebar.download_button("Export JSON", perf_to_json(recording),
+                               file_name=f"perf_{stamp}.json", mime="application/json")
+    st.sidebar.download_button("Export Chrome Trace", perf_to_chrome_trace(recording),
+                               file_name=f"perf_{stamp}.trace.json", mime="application/json")
+
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def load_performance_data(dataset_hash, _files):
+    """データセットのハッシュをキーにデータセットをキャッシュして返す（読み取り専用として全セッションで共有）"""
+    return load_dataset(_files, dataset_hash)
 
-def get_test_config():
-    """Test configuration"""
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_summary_index(dataset_key, _df):
+    """データセットごとにサマリーインデックスをキャッシュして返す"""
+    return build_summary_index(_df)
+
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_trend_index(dataset_key, _df):
+    """データセットごとにトレンド分析結果をキャッシュして返す"""
+    return build_trend_index(_df)
+
+@st.cache_resource(show_spinner=False)
+def get_report_jobs():
+    """レポート生成のジョブ（ジョブID -> ジョブ）と生成済みPDFのキャッシュ（全セッション・再実行で共有）"""
     return {
-        'CMJ': {
-            'name': 'Counter Movement Jump',
-            'metrics': [
-                'Jump Height(cm)',
-                'Countermovement Depth', 
-                'Braking RFD',
-                'Avg. Braking Force',
-                'Avg. Propulsive Force',
-                'mRSI'
-            ],
-            'units': {
-                'Jump Height(cm)': 'cm',
-                'Countermovement Depth': 'm',
-                'Braking RFD': 'N/s',
-                'Avg. Braking Force': 'N',
-                'Avg. Propulsive Force': 'N',
-                'mRSI': ''
-            },
-            'highlight': ['Jump Height(cm)', 'mRSI', 'Avg. Propulsive Force'],
-            'female_norms': {
-                'Jump Height(cm)': {'mean': 33.65, 'std': 4.28},
-                'mRSI': {'mean': 0.47, 'std': 0.08},
-                'Braking RFD': {'mean': 6594.37, 'std': 1858.18}
-            }
-        },
-        'IMTP': {
-            'name': 'Isometric Mid-Thigh Pull',
-            'metrics': [
-                'Peak Force',
-                'Relative Peak Force (BW)',
-                'RFD 0-50 ms',
-                'RFD 0-100 ms',
-                'RFD 0-150 ms',
-                'RFD 0-200 ms',
-                'RFD 0-250 ms'
-            ],
-            'units': {
-                'Peak Force': 'N',
-                'Relative Peak Force (BW)': 'BW',
-                'RFD 0-50 ms': 'N/s',
-                'RFD 0-100 ms': 'N/s',
-                'RFD 0-150 ms': 'N/s',
-                'RFD 0-200 ms': 'N/s',
-                'RFD 0-250 ms': 'N/s'
-            },
-            'highlight': ['Peak Force', 'Relative Peak Force (BW)', 'RFD 0-100 ms'],
-            'female_norms': {
-                'Relative Peak Force (BW)': {'mean': 42.45, 'std': 7.21},
-                'RFD 0-250 ms': {'mean': 102.43, 'std': 23.89}
-            }
-        }
+        'executor': ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='report'),
+        'jobs': {},
+        'cache': OrderedDict(),
+        'lock': threading.Lock()
     }
 
-def safe_get_value(data, column, default=None):
-    """安全に最新値を取得"""
-    try:
-        if column not in data.columns or data.empty:
-            return default
-        
-        valid_data = data[data[column].notna()]
-        valid_data = valid_data[valid_data[column] != '']
-        valid_data = valid_data[valid_data[column] != 0]
-        
-        if valid_data.empty:
-            return default
-        
-        if 'Date' in valid_data.columns:
-            # 日付を確実にdatetime型に変換してから降順ソート
-            valid_data = valid_data.copy()
-            valid_data['Date'] = pd.to_datetime(valid_data['Date'])
-            latest_valid = valid_data.sort_values('Date', ascending=False).iloc[0]
-            value = latest_valid[column]
-        else:
-            value = valid_data.iloc[0][column]
-        
-        if pd.isna(value) or value == '' or value == 0:
-            return default
-        
-        if isinstance(value, (int, float, np.number)):
-            if np.isfinite(value):
-                return float(value)
-        
-        return default
-        
-    except:
-        return default
+def report_cache_key(dataset_key, player_name, output_format='pdf'):
+    """生成済みレポートのキャッシュキー（データセット・選手・出力形式・レポートのバージョン）"""
+    return (dataset_key, player_name, output_format, REPORT_VERSION)
 
-def safe_get_best_value(data, column, default=None):
-    """安全に最高値を取得"""
-    try:
-        if column not in data.columns or data.empty:
-            return default, default
-        
-        valid_data = data[data[column].notna()]
-        valid_data = valid_data[valid_data[column] != '']
-        valid_data = valid_data[valid_data[column] != 0]
-        
-        if valid_data.empty:
-            return default, default
-        
-        numeric_values = pd.to_numeric(valid_data[column], errors='coerce')
-        clean_values = numeric_values.dropna()
-        
-        if clean_values.empty:
-            return default, default
-        
-        max_value = clean_values.max()
-        max_idx = clean_values.idxmax()
+def get_cached_report(dataset_key, player_name, output_format='pdf'):
+    """生成済みのレポートがあれば (出力データ, 統計) を返す"""
+    key = report_cache_key(dataset_key, player_name, output_format)
+    report_jobs = get_report_jobs()
+    with report_jobs['lock']:
+        report = report_jobs['cache'].get(key)
+        if report is not None:
+            report_jobs['cache'].move_to_end(key)
+        return report
+
+def _finish_report_job(report_jobs, job_id, future):
+    """完了したジョブのレポートをキャッシュに保存（古いものから破棄）"""
+    with report_jobs['lock']:
+        job = report_jobs['jobs'].get(job_id)
+        if job is None:
+            return
+        job['finished'] = time.time()
+        if future.cancelled() or future.exception() is not None:
+            return
         
-        best_date = "N/A"
-        if 'Date' in data.columns and max_idx in data.index:
-            date_val = data.loc[max_idx, 'Date']
-            if pd.notna(date_val):
-                # 日付を確実にdatetime型に変換
-                date_val = pd.to_datetime(date_val)
-                best_date = date_val.strftime('%Y-%m-%d')
+        cache = report_jobs['cache']
+        cache[job['key']] = future.result()
+        cache.move_to_end(job['key'])
+        while len(cache) > REPORT_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+def submit_report_job(dataset_key, player_data, all_data, player_name, summary=None, output_format='pdf'):
+    """レポート生成をバックグラウンドに投入してジョブIDを返す（同じレポートを生成中ならそのジョブID）"""
+    key = report_cache_key(dataset_key, player_name, output_format)
+    report_jobs = get_report_jobs()
+    jobs = report_jobs['jobs']
+    
+    with report_jobs['lock']:
+        for job_id, job in jobs.items():
+            if job['key'] == key and not job['future'].done():
+                return job_id
         
-        return float(max_value), best_date
+        # 完了済みのジョブは新しいものだけ残す
+        finished = sorted((job['submitted'], job_id) for job_id, job in jobs.items() if job['future'].done())
+        for _, job_id in finished[:max(0, len(finished) - REPORT_CACHE_MAX_ENTRIES)]:
+            del jobs[job_id]
         
-    except:
-        return default, default
+        job_id = uuid.uuid4().hex
+        future = report_jobs['executor'].submit(render_report, player_data, all_data, player_name, summary, output_format)
+        jobs[job_id] = {
+            'key': key,
+            'athlete': player_name,
+            'future': future,
+            'submitted': time.time(),
+            'finished': None
+        }
+    
+    future.add_done_callback(functools.partial(_finish_report_job, report_jobs, job_id))
+    return job_id
 
-def safe_mean(series):
-    """安全に平均値を計算"""
-    if series.empty:
-        return None
-    numeric_series = pd.to_numeric(series, errors='coerce')
-    clean_series = numeric_series.dropna()
-    clean_series = clean_series[clean_series != 0]
-    return clean_series.mean() if len(clean_series) > 0 else None
+def report_job_status(job_id):
+    """ジョブの状態（queued・running・done・failed・unknown）と経過時間、完了していれば出力データと統計を返す"""
+    report_jobs = get_report_jobs()
+    with report_jobs['lock']:
+        job = report_jobs['jobs'].get(job_id)
+    if job is None:
+        return {'state': 'unknown'}
+    
+    future = job['future']
+    status = {'athlete': job['athlete'], 'elapsed': (job['finished'] or time.time()) - job['submitted']}
+    if not future.done():
+        status['state'] = 'running' if future.running() else 'queued'
+    elif future.cancelled() or future.exception() is not None:
+        status['state'] = 'failed'
+        status['error'] = 'cancelled' if future.cancelled() else str(future.exception())
+    else:
+        status['state'] = 'done'
+        status['data'], status['stats'] = future.result()
+    return status
 
-def format_value(value, unit=""):
-    """値を安全にフォーマット"""
-    if value is None or pd.isna(value):
-        return "N/A"
-    try:
-        formatted_val = f"{float(value):.2f}"
-        return f"{formatted_val}{unit}" if unit else formatted_val
-    except:
-        return "N/A"
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_athlete_names(dataset_key, _df):
+    """データセットごとに選手名の一覧をキャッシュして返す"""
+    return _df['Name'].dropna().unique()
 
-# レポート生成関数群
-def create_individual_report(player_data, all_data, player_name):
-    """個人レポートを作成"""
-    plt.style.use('default')
-    sns.set_palette("husl")
-    
-    # フィギュアサイズをA4に設定 (8.27 x 11.69 inch)
-    fig = plt.figure(figsize=(8.27, 11.69))
-    
-    # グリッドレイアウト設定: 6行2列（Team部分を下に移動）
-    gs = fig.add_gridspec(6, 2, height_ratios=[0.8, 1, 1, 0.8, 1, 1], hspace=0.7, wspace=0.35)
-    
-    # タイトル（さらに20ポイント下げる）
-    fig.suptitle(f'Performance Report - {player_name}', fontsize=16, fontweight='bold', y=0.955)
-    
-    # 1. 個人の表（Team表と同じ高さに調整）
-    ax_table1 = fig.add_subplot(gs[0, :])
-    ax_table1.axis('off')
-    ax_table1.text(0.5, 0.95, 'Individual Performance Summary', 
-                   fontsize=14, fontweight='bold', ha='center', transform=ax_table1.transAxes)
-    
-    # 個人データテーブル作成
-    individual_table_data = create_individual_summary_table(player_data)
-    if individual_table_data:
-        table1 = ax_table1.table(cellText=individual_table_data['data'],
-                                colLabels=individual_table_data['headers'],
-                                cellLoc='center',
-                                loc='center',
-                                bbox=[0.03, 0.15, 0.94, 0.75])  # 幅を20ポイント拡大 (0.05→0.03, 0.9→0.94)
-        table1.auto_set_font_size(False)
-        table1.set_fontsize(7)
-        table1.scale(1, 2.2)  # Team表と同じ縦幅スケール
-        
-        # ヘッダーのスタイル設定
-        for i in range(len(individual_table_data['headers'])):
-            table1[(0, i)].set_facecolor('#2D3748')
-            table1[(0, i)].set_text_props(weight='bold', color='white')
-    
-    # 2. 個人の4つの推移グラフ（サイズを統一）
-    metric_list = ['Jump Height(cm)', 'mRSI', 'Braking RFD', 'Relative Peak Force (BW)']
-    positions = [(1, 0), (1, 1), (2, 0), (2, 1)]  # 2x2グリッド
-    
-    for i, (metric, pos) in enumerate(zip(metric_list, positions)):
-        ax = fig.add_subplot(gs[pos])
-        create_single_metric_graph(ax, player_data, metric, f'Individual {metric}', individual=True)
-    
-    # 3. チーム比較の表
-    ax_table2 = fig.add_subplot(gs[3, :])
-    ax_table2.axis('off')
-    ax_table2.text(0.5, 0.98, 'Team Average Comparison', 
-                   fontsize=14, fontweight='bold', ha='center', transform=ax_table2.transAxes)
-    
-    # チーム比較テーブル作成
-    team_table_data = create_team_comparison_summary_table(player_data, all_data)
-    if team_table_data:
-        table2 = ax_table2.table(cellText=team_table_data['data'],
-                                colLabels=team_table_data['headers'],
-                                cellLoc='center',
-                                loc='center',
-                                bbox=[0.03, 0.15, 0.94, 0.75])  # 幅を20ポイント拡大 (0.05→0.03, 0.9→0.94)
-        table2.auto_set_font_size(False)
-        table2.set_fontsize(7)
-        table2.scale(1, 2.2)  # Individual表と同じ縦幅スケール
-        
-        # ヘッダーのスタイル設定
-        for i in range(len(team_table_data['headers'])):
-            table2[(0, i)].set_facecolor('#2D3748')
-            table2[(0, i)].set_text_props(weight='bold', color='white')
-    
-    # 4. チームの4つの推移グラフ（サイズを統一）
-    team_positions = [(4, 0), (4, 1), (5, 0), (5, 1)]  # 2x2グリッド
-    
-    for i, (metric, pos) in enumerate(zip(metric_list, team_positions)):
-        ax = fig.add_subplot(gs[pos])
-        create_single_metric_graph(ax, all_data, metric, f'Team {metric}', individual=False)
-    
-    # 日付情報を追加
-    all_dates = player_data['Date'].dropna()
-    if not all_dates.empty:
-        all_dates = pd.to_datetime(all_dates).sort_values(ascending=False)
-        latest_date = all_dates.iloc[0].strftime('%Y-%m-%d')
-        oldest_date = all_dates.iloc[-1].strftime('%Y-%m-%d')
-        fig.text(0.02, 0.005, f'Report Period: {oldest_date} to {latest_date}', 
-                fontsize=8, ha='left')
-    
-    fig.text(0.98, 0.005, f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}', 
-            fontsize=8, ha='right')
-    
-    plt.tight_layout()
-    return fig
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_player_frames(dataset_key, _df):
+    """データセットごとに選手別のデータを一度だけ分割してキャッシュ"""
+    return {name: frame for name, frame in _df.groupby('Name', observed=True, sort=False)}
 
-def create_individual_summary_table(player_data):
-    """個人サマリーテーブルを作成"""
-    headers = ['Metric', 'Latest Value', 'Personal Best', 'Test Date']
-    data = []
-    
-    for test_type, metrics in REPORT_METRICS.items():
-        test_data = player_data[player_data['Type'] == test_type]
-        if test_data.empty:
-            continue
-            
-        for metric in metrics:
-            if metric not in test_data.columns:
-                continue
-                
-            latest_val = safe_get_value(test_data, metric)
-            best_val, best_date = safe_get_best_value(test_data, metric)
-            
-            # 最新のテスト日付取得
-            latest_date = "N/A"
-            if latest_val is not None:
-                valid_data = test_data.dropna(subset=[metric])
-                valid_data = valid_data[valid_data[metric] != 0]
-                if not valid_data.empty and 'Date' in valid_data.columns:
-                    valid_data = valid_data.copy()
-                    valid_data['Date'] = pd.to_datetime(valid_data['Date'])
-                    latest_valid = valid_data.sort_values('Date', ascending=False).iloc[0]
-                    latest_date = latest_valid['Date'].strftime('%Y-%m-%d') if pd.notna(latest_valid['Date']) else "N/A"
-            
-            data.append([
-                metric,
-                format_value(latest_val),
-                format_value(best_val),
-                latest_date
-            ])
-    
-    return {'headers': headers, 'data': data} if data else None
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_dataset_overview(dataset_key, _df):
+    """データセットの件数（選手数・テスト数・テストタイプ別件数）と日付の範囲をキャッシュして返す"""
+    dates = _df['Date'].dropna() if 'Date' in _df.columns else pd.Series(dtype='datetime64[ns]')
+    return {
+        'total_athletes': len(_df['Name'].unique()),
+        'total_tests': len(_df),
+        'type_counts': _df['Type'].value_counts().to_dict(),
+        'date_range': (dates.min(), dates.max()) if not dates.empty else None
+    }
 
-def create_team_comparison_summary_table(player_data, all_data):
-    """チーム比較サマリーテーブルを作成"""
-    headers = ['Metric', 'Individual', 'Team Average', 'Percentile Rank']
-    data = []
-    
-    for test_type, metrics in REPORT_METRICS.items():
-        test_data = player_data[player_data['Type'] == test_type]
-        team_data = all_data[all_data['Type'] == test_type]
-        
-        if test_data.empty or team_data.empty:
-            continue
-            
-        for metric in metrics:
-            if metric not in test_data.columns or metric not in team_data.columns:
-                continue
-                
-            player_val = safe_get_value(test_data, metric)
-            team_avg = safe_mean(team_data[metric])
-            
-            # パーセンタイル計算
-            percentile = "N/A"
-            if player_val is not None:
-                team_values = pd.to_numeric(team_data[metric], errors='coerce').dropna()
-                team_values = team_values[team_values != 0]
-                if len(team_values) > 0:
-                    percentile_val = (team_values < player_val).sum() / len(team_values) * 100
-                    percentile = f"{percentile_val:.0f}%"
-            
-            data.append([
-                metric,
-                format_value(player_val),
-                format_value(team_avg),
-                percentile
-            ])
-    
-    return {'headers': headers, 'data': data} if data else None
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_team_statistics(dataset_key, squads, _df, _config, _cube):
+    """データセット・チームの組み合わせごとに各テストタイプのチーム統計をキャッシュして返す"""
+    return compute_team_statistics(_df, _config, _cube, squads)
 
-def create_single_metric_graph(ax, data, metric, title, individual=True):
-    """単一のメトリクスグラフを作成"""
-    ax.set_title(title, fontsize=9, fontweight='bold', pad=6)
-    
-    colors = {'Jump Height(cm)': '#2D3748', 'mRSI': '#DC2626', 
-              'Braking RFD': '#059669', 'Relative Peak Force (BW)': '#7C3AED'}
-    color = colors.get(metric, '#2D3748')
-    
-    has_data = False
-    
-    if individual:
-        # 個人データの処理
-        for test_type, metrics in REPORT_METRICS.items():
-            if metric in metrics:
-                test_data = data[data['Type'] == test_type]
-                if test_data.empty:
-                    continue
-                    
-                if metric not in test_data.columns:
-                    continue
-                    
-                # 有効なデータをフィルター
-                valid_data = test_data.dropna(subset=[metric, 'Date'])
-                valid_data = valid_data[valid_data[metric] != 0]
-                
-                if len(valid_data) < 1:
-                    continue
-                    
-                # 日付変換とソート
-                valid_data = valid_data.copy()
-                valid_data['Date'] = pd.to_datetime(valid_data['Date'])
-                valid_data = valid_data.sort_values('Date')
-                
-                # 数値変換
-                valid_data[metric] = pd.to_numeric(valid_data[metric], errors='coerce')
-                valid_data = valid_data.dropna(subset=[metric])
-                
-                if len(valid_data) < 1:
-                    continue
-                
-                # プロット
-                ax.plot(valid_data['Date'], valid_data[metric], 
-                       marker='o', linewidth=2.5, markersize=5,
-                       color=color, markerfacecolor='white', 
-                       markeredgecolor=color, markeredgewidth=2)
-                
-                has_data = True
-                break
-    else:
-        # チームデータの処理（月別平均）
-        for test_type, metrics in REPORT_METRICS.items():
-            if metric in metrics:
-                test_data = data[data['Type'] == test_type]
-                if test_data.empty:
-                    continue
-                    
-                if metric not in test_data.columns:
-                    continue
-                    
-                # 有効なデータをフィルター
-                valid_data = test_data.dropna(subset=[metric, 'Date'])
-                valid_data = valid_data[valid_data[metric] != 0]
-                
-                if len(valid_data) < 1:
-                    continue
-                
-                # 日付変換
-                valid_data = valid_data.copy()
-                valid_data['Date'] = pd.to_datetime(valid_data['Date'])
-                valid_data[metric] = pd.to_numeric(valid_data[metric], errors='coerce')
-                valid_data = valid_data.dropna(subset=[metric])
-                
-                if len(valid_data) < 1:
-                    continue
-                
-                # 月別平均を計算
-                valid_data['YearMonth'] = valid_data['Date'].dt.to_period('M')
-                monthly_avg = valid_data.groupby('YearMonth')[metric].mean().reset_index()
-                monthly_avg['Date'] = monthly_avg['YearMonth'].dt.to_timestamp()
-                
-                if len(monthly_avg) < 1:
-                    continue
-                
-                # プロット
-                ax.plot(monthly_avg['Date'], monthly_avg[metric], 
-                       marker='s', linewidth=2.5, markersize=5,
-                       color=color, linestyle='--', alpha=0.8,
-                       markerfacecolor='white', markeredgecolor=color, markeredgewidth=2)
-                
-                has_data = True
-                break
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_roster_table(dataset_key, _summary, _config):
+    """データセットごとにロースター表（全選手×全メトリクス）をキャッシュして返す"""
+    return build_roster_table(_summary, _config)
+
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_roster_csv(dataset_key, _table):
+    """データセットごとにロースター表のCSVをキャッシュして返す"""
+    return roster_table_csv(_table).encode('utf-8')
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets法で形状を保つ点のインデックスを選択"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
     
-    if has_data:
-        ax.grid(True, alpha=0.3, linewidth=0.5)
-        ax.tick_params(axis='x', rotation=45, labelsize=6)  # X軸文字サイズを6に縮小
-        ax.tick_params(axis='y', labelsize=7)
-        
-        # X軸の日付フォーマット（より短い形式）
-        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        ax.xaxis.set_major_locator(mdates.MonthLocator(interval=3))  # 3ヶ月間隔に変更
-        
-        # Y軸ラベル
-        units = {
-            'Jump Height(cm)': 'cm',
-            'mRSI': '',
-            'Braking RFD': 'N/s',
-            'Relative Peak Force (BW)': 'BW'
-        }
-        unit = units.get(metric, '')
-        if unit:
-            ax.set_ylabel(unit, fontsize=7)
-    else:
-        ax.text(0.5, 0.5, 'No data available', 
-               ha='center', va='center', transform=ax.transAxes,
-               fontsize=8, color='gray')
-        ax.set_xticks([])
-        ax.set_yticks([])
+    # 先頭・末尾以外を (threshold - 2) 個のバケットに分割し、各バケットから1点ずつ選ぶ
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # 次のバケットの平均点（最後のバケットは末尾の点）
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # 前に選んだ点・次のバケットの平均点と作る三角形の面積が最大の点
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
 
-def generate_pdf_report(player_data, all_data, player_name):
-    """PDFレポートを生成してダウンロード可能な形式で返す"""
-    # レポート作成
-    fig = create_individual_report(player_data, all_data, player_name)
+def downsample_series(dates, values, max_points=None):
+    """時系列をLTTBで間引く（自己ベストの点は必ず残す）"""
+    max_points = max_points or CHART_MAX_POINTS
+    if len(values) <= max_points:
+        return dates, values
     
-    # PDFに保存
-    buffer = BytesIO()
-    with PdfPages(buffer) as pdf:
-        pdf.savefig(fig, bbox_inches='tight', dpi=300)
+    # 日付のない点はグラフに表示されないため除外
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    dated = ~np.isnat(dates)
+    dates, values = dates[dated], np.asarray(values, dtype=float)[dated]
+    if len(values) <= max_points:
+        return dates, values
     
-    plt.close(fig)
-    buffer.seek(0)
+    keep = lttb_indices(dates.astype(np.int64).astype(float), values, max_points)
+    keep = np.union1d(keep, [int(np.argmax(values))])
+    return dates[keep], values[keep]
+
+def scatter_trace_type(point_count):
+    """図全体の点数が多い場合はWebGL描画（Scattergl）を使用"""
+    return go.Scattergl if point_count > WEBGL_POINT_THRESHOLD else go.Scatter
+
+def trend_overlay_traces(trend_data, trace_type, color, name, columns=('chronic', 'ewma')):
+    """移動平均・EWMAを重ね描きするトレースを作成"""
+    dash_styles = {'acute': 'dot', 'chronic': 'dot', 'ewma': 'dash'}
+    traces = []
+    for column in columns:
+        dates, values = downsample_series(trend_data['Date'].to_numpy(), trend_data[column].to_numpy())
+        label = TREND_COLUMNS[column]
+        traces.append(trace_type(
+            x=dates,
+            y=values,
+            mode='lines',
+            name=f"{name} {label}",
+            line=dict(color=color, width=2, dash=dash_styles[column]),
+            opacity=0.6,
+            legendgroup=name,
+            showlegend=False,
+            hovertemplate=f'<b>{name}</b> {label}<br>Date: %{{x}}<br>%{{y:.2f}}<extra></extra>'
+        ))
+    return traces
+
+@perf_traced
+def split_athlete_series(df, config):
+    """データを一度だけ (テストタイプ, 選手) ごとに分割し、メトリクスごとの (日付, 値) 配列を作成"""
+    data = df.sort_values('Date', kind='stable')
     
-    return buffer.getvalue()
+    series = {test_type: {} for test_type in config}
+    for (test_type, athlete), athlete_data in data.groupby(['Type', 'Name'], observed=True, sort=False):
+        if test_type not in config:
+            continue
+        
+        dates = athlete_data['Date'].to_numpy()
+        series[test_type][athlete] = {}
+        for metric in config[test_type]['metrics']:
+            if metric not in data.columns:
+                continue
+            # 有効なデータ（数値・非ゼロ）のみ
+            values = athlete_data[metric].to_numpy(dtype=float)
+            valid = np.isfinite(values) & (values != 0)
+            if valid.any():
+                series[test_type][athlete][metric] = (dates[valid], values[valid])
+    return series
 
-def create_comparison_table(player_data, all_data, metrics, test_type, config):
-    """比較テーブルを作成"""
-    table_data = []
+@st.cache_resource(max_entries=DATASET_CACHE_MAX_ENTRIES, show_spinner=False)
+def get_athlete_series(dataset_key, _df, _config):
+    """データセットごとに全テストタイプの選手別の時系列をキャッシュして返す"""
+    return split_athlete_series(_df, _config)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_team_comparison_chart(dataset_key, test_type, athletes, show_trends, _df, _config):
+    """(データセット, テストタイプ, 選手の組み合わせ, トレンド表示) ごとに比較チャートをキャッシュして返す"""
+    series = get_athlete_series(dataset_key, _df, _config)[test_type]
+    trends = get_trend_index(dataset_key, _df) if show_trends else None
+    return create_team_comparison_chart(_df, list(athletes), test_type, _config, series, trends)
+
+def create_team_trend_chart(cube, test_type, config, granularity='month', squads=None):
+    """チームの期間別平均と±1標準偏差の帯を集計キューブから作成"""
+    if not PLOTLY_AVAILABLE:
+        return None
+    
+    test_config = config[test_type]
+    units = test_config['units']
+    trends = {metric: cube_trend(cube, test_type, metric, granularity, squads) for metric in test_config['metrics']}
+    metrics = [metric for metric, trend in trends.items() if not trend.empty]
+    if not metrics:
+        return None
     
-    test_data = all_data[all_data['Type'] == test_type]
-    female_norms = config[test_type].get('female_norms', {})
+    # サブプロットの設定
+    rows = (len(metrics) + 1) // 2
+    cols = min(2, len(metrics))
+    
+    fig = make_subplots(
+        rows=rows,
+        cols=cols,
+        subplot_titles=[f"<b>{metric}</b>" for metric in metrics],
+        vertical_spacing=0.18,
+        horizontal_spacing=0.15
+    )
     
-    for metric in metrics:
-        player_val = safe_get_value(player_data, metric)
-        best_val, best_date = safe_get_best_value(player_data, metric)
-        avg_val = safe_mean(test_data[metric])
+    for i, metric in enumerate(metrics):
+        row = (i // 2) + 1
+        col = (i % 2) + 1
         
-        female_norm_text = "N/A"
-        if metric in female_norms:
-            mean_val = female_norms[metric]['mean']
-            std_val = female_norms[metric]['std']
-            female_norm_text = f"{mean_val:.2f} ± {std_val:.2f}"
+        trend = trends[metric]
+        dates = trend.index
+        mean = trend['mean']
+        std = trend['std'].fillna(0)
         
-        measurement_date = "N/A"
-        if player_val is not None:
-            valid_data = player_data.dropna(subset=[metric])
-            valid_data = valid_data[valid_data[metric] != 0]
-            if not valid_data.empty and 'Date' in valid_data.columns:
-                # 日付を確実にdatetime型に変換してから降順ソート
-                valid_data = valid_data.copy()
-                valid_data['Date'] = pd.to_datetime(valid_data['Date'])
-                latest_valid = valid_data.sort_values('Date', ascending=False).iloc[0]
-                measurement_date = latest_valid['Date'].strftime('%Y-%m-%d') if pd.notna(latest_valid['Date']) else "N/A"
+        # ±1標準偏差の帯
+        fig.add_trace(
+            go.Scatter(x=dates, y=mean + std, mode='lines', line=dict(width=0),
+                       showlegend=False, hoverinfo='skip'),
+            row=row, col=col
+        )
+        fig.add_trace(
+            go.Scatter(x=dates, y=mean - std, mode='lines', line=dict(width=0),
+                       fill='tonexty', fillcolor='rgba(45, 55, 72, 0.15)',
+                       showlegend=False, hoverinfo='skip'),
+            row=row, col=col
+        )
         
-        best_value_text = "N/A"
-        if best_val is not None:
-            best_value_text = f"{best_val:.2f}"
-            if best_date != "N/A":
-                best_value_text += f" ({best_date})"
+        # 期間ごとの平均
+        fig.add_trace(
+            go.Scatter(
+                x=dates,
+                y=mean,
+                mode='lines+markers',
+                line=dict(color='#2D3748', width=3),
+                marker=dict(size=7, line=dict(width=2, color='white')),
+                customdata=np.column_stack([trend['std'], trend['count']]),
+                showlegend=False,
+                hovertemplate=f'Period: %{{x|%Y-%m-%d}}<br>{metric}: %{{y:.2f}} ± %{{customdata[0]:.2f}}'
+                              '<br>n = %{customdata[1]:.0f}<extra></extra>'
+            ),
+            row=row, col=col
+        )
         
-        table_data.append({
-            'Metric': metric,
-            'Latest Value': format_value(player_val),
-            'Test Date': measurement_date,
-            'Personal Best': best_value_text,
-            'Team Average': format_value(avg_val),
-            'Female Fencer Norm': female_norm_text
-        })
-    
-    return pd.DataFrame(table_data)
+        # 軸の設定
+        unit = units.get(metric, '')
+        fig.update_yaxes(
+            title_text=f"{unit}" if unit else "Value",
+            row=row, col=col,
+            gridcolor='rgba(0,0,0,0.08)',
+            linecolor='rgba(0,0,0,0.2)',
+            title_font=dict(size=12, color='#2D3748'),
+            tickfont=dict(size=10)
+        )
+        fig.update_xaxes(
+            row=row, col=col,
+            gridcolor='rgba(0,0,0,0.08)',
+            linecolor='rgba(0,0,0,0.2)',
+            tickfont=dict(size=10)
+        )
+    
+    fig.update_layout(
+        title=dict(
+            text=f"{test_config['name']} - {CUBE_PERIOD_LABELS[granularity]} Team Mean ± 1 SD",
+            x=0.5,
+            font=dict(size=18, color='#2D3748', family='Arial Black')
+        ),
+        height=350 * rows,
+        plot_bgcolor='rgba(247, 250, 252, 0.3)',
+        paper_bgcolor='white',
+        margin=dict(l=50, r=50, t=80, b=50),
+        font=dict(family="Arial")
+    )
+    
+    return fig
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_team_trend_chart(dataset_key, test_type, granularity, squads, _cube, _config):
+    """(データセット, テストタイプ, 期間, チーム) ごとにチーム推移チャートをキャッシュして返す"""
+    return create_team_trend_chart(_cube, test_type, _config, granularity, squads)
 
-def create_team_comparison_chart(df, selected_athletes, test_type, config):
-    """複数選手の比較チャートを作成"""
+@perf_traced
+def create_team_comparison_chart(df, selected_athletes, test_type, config, series=None, trends=None):
+    """複数選手の比較チャートを作成（トレンド分析結果があればEWMAを重ね描き）"""
     if not PLOTLY_AVAILABLE:
         return None
     
@@ -768,15 +605,19 @@ def create_team_comparison_chart(df, selected_athletes, test_type, config):
         '#0891B2', '#BE185D', '#65A30D', '#9333EA', '#C2410C'
     ]
     
-    # データをフィルター
-    team_data = df[(df['Type'] == test_type) & (df['Name'].isin(selected_athletes))].copy()
+    # 選手ごとに分割済みのデータ
+    if series is None:
+        series = split_athlete_series(df[df['Name'].isin(selected_athletes)], {test_type: test_config})[test_type]
     
-    if team_data.empty:
+    if not any(athlete in series for athlete in selected_athletes):
         return None
     
-    # 日付でソート
-    team_data['Date'] = pd.to_datetime(team_data['Date'])
-    team_data = team_data.sort_values('Date')
+    # 長い時系列は間引いてから描画（点数が多い場合はWebGL）
+    series = {
+        athlete: {metric: downsample_series(*series[athlete][metric]) for metric in series[athlete]}
+        for athlete in selected_athletes if athlete in series
+    }
+    trace_type = scatter_trace_type(sum(len(values) for athlete_series in series.values() for _, values in athlete_series.values()))
     
     # サブプロットの設定
     rows = (len(metrics) + 1) // 2
@@ -791,39 +632,24 @@ def create_team_comparison_chart(df, selected_athletes, test_type, config):
     )
     
     for i, metric in enumerate(metrics):
-        if metric not in team_data.columns:
+        if metric not in df.columns:
             continue
             
         row = (i // 2) + 1
         col = (i % 2) + 1
         
         for j, athlete in enumerate(selected_athletes):
-            athlete_data = team_data[team_data['Name'] == athlete]
-            
-            if athlete_data.empty:
-                continue
-            
-            # 有効なデータのみフィルター
-            valid_data = athlete_data.dropna(subset=[metric])
-            valid_data = valid_data[valid_data[metric] != 0]
-            
-            if len(valid_data) < 1:
-                continue
-            
-            # 数値変換
-            valid_data[metric] = pd.to_numeric(valid_data[metric], errors='coerce')
-            valid_data = valid_data.dropna(subset=[metric])
-            
-            if len(valid_data) < 1:
+            if metric not in series.get(athlete, {}):
                 continue
             
+            dates, values = series[athlete][metric]
             color = athlete_colors[j % len(athlete_colors)]
             
             # ラインプロット
             fig.add_trace(
-                go.Scatter(
-                    x=valid_data['Date'],
-                    y=valid_data[metric],
+                trace_type(
+                    x=dates,
+                    y=values,
                     mode='lines+markers',
                     name=athlete,  # 選手名のみを凡例に表示
                     line=dict(
@@ -841,6 +667,12 @@ def create_team_comparison_chart(df, selected_athletes, test_type, config):
                 ),
                 row=row, col=col
             )
+            
+            # EWMAの重ね描き
+            trend_data = trend_series(trends, athlete, test_type, metric) if trends is not None else None
+            if trend_data is not None:
+                for trace in trend_overlay_traces(trend_data, trace_type, color, athlete, columns=('ewma',)):
+                    fig.add_trace(trace, row=row, col=col)
         
         # 軸の設定
         unit = units.get(metric, '')
@@ -880,188 +712,233 @@ def create_team_comparison_chart(df, selected_athletes, test_type, config):
     
     return fig
 
-def main():
-    # Header
-    st.markdown('<div class="main-header">Fencing Performance Test</div>', 
-                unsafe_allow_html=True)
+def append_session_data(dataset_hash, df, summary, load_info):
+    """サイドバーから新しいセッションの試技を取り込み、差分更新したデータセットを返す"""
+    appended = st.session_state.get('appended_dataset')
+    if appended is not None and appended['base_key'] != dataset_hash:
+        # 元のファイルが変わった場合は追加分を破棄
+        del st.session_state['appended_dataset']
+        appended = None
     
-    # Page navigation
-    st.markdown('<div class="page-nav">', unsafe_allow_html=True)
-    page = st.selectbox(
-        "Select Analysis Type",
-        ["Individual Analysis", "Team Analysis"],
-        help="Choose between individual athlete analysis or team performance trends"
-    )
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # File upload
-    uploaded_file = st.file_uploader(
-        "Upload your performance data file",
+    st.sidebar.markdown("### Append Session Data")
+    delta_file = st.sidebar.file_uploader(
+        "Upload new testing sessions",
         type=['xlsx', 'xls'],
-        help="Please upload Excel file with 'CMJ' and 'IMTP' sheets"
+        key='delta_file',
+        help=f"Excel file with new trials in any of the sheets {list(DATA_SHEETS)}. Trials already in the dataset are skipped."
     )
     
-    if uploaded_file is None:
-        st.info("Please upload a data file to begin analysis.")
-        st.markdown("""
-        ### Expected Data Format:
-        Excel file with two sheets: 'CMJ' and 'IMTP'
+    if delta_file is not None and st.sidebar.button("➕ Append to Dataset"):
+        delta_content = delta_file.getvalue()
+        try:
+            new_trials = read_trials(delta_content)
+        except Exception as e:
+            st.sidebar.error(f"Excel loading error: {str(e)}")
+            new_trials = None
+        if new_trials is not None:
+            new_trials['Source'] = delta_file.name
         
-        Each sheet should have:
-        - Column A: ID
-        - Column B: Name
-        - Column C: Date
-        - Remaining columns: Test metrics
-        """)
+        if new_trials is None or new_trials.empty:
+            st.sidebar.error("No valid trials found in the uploaded file")
+        else:
+            current = appended or {
+                'key': dataset_hash, 'df': df, 'summary': summary,
+                'ingest_index': build_ingest_index(df, load_info.get('trial_hashes'))
+            }
+            with st.spinner("Appending new sessions..."):
+                new_df, new_summary, ingest_index, report = ingest_incremental(
+                    current['df'], current['summary'], new_trials, current['ingest_index']
+                )
+            
+            # データセットキーは元のキーと差分ファイルのハッシュから作成
+            dataset_key = current['key']
+            if new_df is not current['df']:
+                dataset_key = hashlib.sha256(f"{dataset_key}:{compute_file_hash(delta_content)}".encode()).hexdigest()
+            
+            appended = {
+                'base_key': dataset_hash,
+                'key': dataset_key,
+                'df': new_df,
+                'summary': new_summary,
+                'ingest_index': ingest_index,
+                'report': report
+            }
+            st.session_state['appended_dataset'] = appended
+    
+    if appended is None:
+        return dataset_hash, df, summary
+    
+    report = appended['report']
+    st.sidebar.success(
+        f"Last append: {report['new_rows']} new trials, {report['added']} sessions added, "
+        f"{report['replaced']} best trials replaced"
+    )
+    st.sidebar.caption(
+        f"Already loaded (skipped): {report['duplicates_skipped']} / Lower trials removed: {report['dropped_trials']}"
+    )
+    if report.get('coercion_failures'):
+        st.sidebar.warning(f"Unparseable values set to missing: {format_coercion_failures(report['coercion_failures'])}")
+    
+    if st.sidebar.button("Discard Appended Sessions"):
+        del st.session_state['appended_dataset']
+        st.rerun()
+    
+    return appended['key'], appended['df'], appended['summary']
+
+@st.fragment(run_every=REPORT_POLL_INTERVAL)
+def report_job_progress(job_id):
+    """生成中のレポートの状態を定期的に確認し、完了したらページを更新してダウンロードを表示"""
+    status = report_job_status(job_id)
+    if status['state'] in ('queued', 'running'):
+        st.info(f"⏳ Generating report for {status['athlete']}... ({status['elapsed']:.0f}s)")
+    else:
+        st.rerun()
+
+def render_report_download(dataset_key, player_data, df, player_name, summary):
+    """レポートの形式選択・生成ボタン・進行状況・ダウンロードを表示（生成はバックグラウンドで実行）"""
+    output_format = st.selectbox("Report format", list(REPORT_FORMATS), format_func=str.upper, key='report_format')
+    jobs = st.session_state.setdefault('report_jobs', {})
+    key = report_cache_key(dataset_key, player_name, output_format)
+    report = get_cached_report(dataset_key, player_name, output_format)
+    
+    # このセッションで投入したジョブの状態を確認
+    if report is None and key in jobs:
+        status = report_job_status(jobs[key])
+        if status['state'] in ('queued', 'running'):
+            report_job_progress(jobs[key])
+            return
+        if status['state'] == 'done':
+            report = status['data'], status['stats']
+        elif status['state'] == 'failed':
+            st.error(f"Report generation failed: {status['error']}")
+            st.info("Please ensure matplotlib and seaborn are installed")
+        if report is None:
+            del jobs[key]
+    
+    if report is not None:
+        report_data, stats = report
+        st.download_button(
+            label="📥 Download Report",
+            data=report_data,
+            file_name=report_file_name(player_name, output_format),
+            mime=REPORT_FORMATS[output_format],
+            use_container_width=True
+        )
+        st.success("✅ Report generated successfully!")
+        st.caption(format_report_stats(stats))
+        return
+    
+    if st.button("📄 Generate Report", type="primary", use_container_width=True):
+        jobs[key] = submit_report_job(dataset_key, player_data, df, player_name, summary, output_format)
+        report_job_progress(jobs[key])
+
+def render_individual_page(dataset_key, df, summary, config):
+    """個人分析ページを表示"""
+    # Athlete selection
+    available_names = get_athlete_names(dataset_key, df)
+    if len(available_names) == 0:
+        st.error("No athlete data found.")
         st.stop()
     
-    # Load data using manual method
-    st.info("Loading data...")
+    selected_name = st.selectbox("Select Athlete", available_names)
+    player_data = get_player_frames(dataset_key, df).get(selected_name, df.iloc[:0])
+    trends = get_trend_index(dataset_key, df)
     
-    try:
-        # 手動でExcelを読み込み
-        data_dict = load_excel_manually(uploaded_file)
-        
-        if data_dict is None:
-            st.error("Failed to load Excel file")
-            st.stop()
-        
-        # DataFrameを作成
-        df = create_dataframe_from_dict(data_dict)
-        
-        if df.empty:
-            st.error("No valid data found")
-            st.stop()
-        
-        # 重複処理
-        for test_type in ['CMJ', 'IMTP']:
-            test_data = df[df['Type'] == test_type]
-            
-            if test_type == 'CMJ' and 'Jump Height(cm)' in test_data.columns:
-                test_data = test_data.dropna(subset=['Jump Height(cm)'])
-                test_data['Jump Height(cm)'] = pd.to_numeric(test_data['Jump Height(cm)'], errors='coerce')
-                test_data = test_data.dropna(subset=['Jump Height(cm)'])
-                if not test_data.empty:
-                    test_data = test_data.sort_values('Jump Height(cm)', ascending=False)
-                    test_data = test_data.drop_duplicates(subset=['Name', 'Date'], keep='first')
-                    df = df[df['Type'] != test_type]
-                    df = pd.concat([df, test_data], ignore_index=True)
-            
-            elif test_type == 'IMTP' and 'Relative Peak Force (BW)' in test_data.columns:
-                test_data = test_data.dropna(subset=['Relative Peak Force (BW)'])
-                test_data['Relative Peak Force (BW)'] = pd.to_numeric(test_data['Relative Peak Force (BW)'], errors='coerce')
-                test_data = test_data.dropna(subset=['Relative Peak Force (BW)'])
-                if not test_data.empty:
-                    test_data = test_data.sort_values('Relative Peak Force (BW)', ascending=False)
-                    test_data = test_data.drop_duplicates(subset=['Name', 'Date'], keep='first')
-                    df = df[df['Type'] != test_type]
-                    df = pd.concat([df, test_data], ignore_index=True)
-        
-    except Exception as e:
-        st.error(f"Error processing data: {str(e)}")
-        import traceback
-        st.code(traceback.format_exc())
+    if player_data.empty:
+        st.error(f"No data found for athlete '{selected_name}'.")
         st.stop()
     
-    # Test configuration
-    config = get_test_config()
+    # Display athlete info
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.markdown(f'<div class="player-title">{selected_name}</div>', unsafe_allow_html=True)
+    with col2:
+        all_dates = player_data['Date'].dropna()
+        if not all_dates.empty:
+            # 日付を確実にdatetime型に変換してからソート
+            all_dates = pd.to_datetime(all_dates).sort_values(ascending=False)
+            latest_date = all_dates.iloc[0].strftime('%Y-%m-%d')
+            oldest_date = all_dates.iloc[-1].strftime('%Y-%m-%d')
+            st.markdown(f'<div class="date-info">Test Period: {oldest_date} ~ {latest_date}</div>', unsafe_allow_html=True)
+        else:
+            st.markdown('<div class="date-info">Test Date: N/A</div>', unsafe_allow_html=True)
     
-    # Individual Analysis Page
-    if page == "Individual Analysis":
-        # Athlete selection
-        available_names = df['Name'].dropna().unique()
-        if len(available_names) == 0:
-            st.error("No athlete data found.")
-            st.stop()
+    # Process each test type
+    for test_type, test_config in config.items():
+        test_player_data = player_data[player_data['Type'] == test_type]
         
-        selected_name = st.selectbox("Select Athlete", available_names)
-        player_data = df[df['Name'] == selected_name]
-        
-        if player_data.empty:
-            st.error(f"No data found for athlete '{selected_name}'.")
-            st.stop()
+        if test_player_data.empty:
+            continue
         
-        # Display athlete info
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.markdown(f'<div class="player-title">{selected_name}</div>', unsafe_allow_html=True)
-        with col2:
-            all_dates = player_data['Date'].dropna()
-            if not all_dates.empty:
-                # 日付を確実にdatetime型に変換してからソート
-                all_dates = pd.to_datetime(all_dates).sort_values(ascending=False)
-                latest_date = all_dates.iloc[0].strftime('%Y-%m-%d')
-                oldest_date = all_dates.iloc[-1].strftime('%Y-%m-%d')
-                st.markdown(f'<div class="date-info">Test Period: {oldest_date} ~ {latest_date}</div>', unsafe_allow_html=True)
-            else:
-                st.markdown('<div class="date-info">Test Date: N/A</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="section-header">{test_config["name"]} ({test_type})</div>', unsafe_allow_html=True)
         
-        # Process each test type
-        for test_type, test_config in config.items():
-            test_player_data = player_data[player_data['Type'] == test_type]
-            
-            if test_player_data.empty:
-                continue
+        # Key Indicators
+        if test_config['highlight']:
+            st.markdown("### Key Indicators")
+            highlight_cols = st.columns(len(test_config['highlight']))
             
-            st.markdown(f'<div class="section-header">{test_config["name"]} ({test_type})</div>', unsafe_allow_html=True)
-            
-            # Key Indicators
-            if test_config['highlight']:
-                st.markdown("### Key Indicators")
-                highlight_cols = st.columns(len(test_config['highlight']))
-                
-                for i, metric in enumerate(test_config['highlight']):
-                    with highlight_cols[i]:
-                        player_val = safe_get_value(test_player_data, metric)
-                        best_val, best_date = safe_get_best_value(test_player_data, metric)
-                        test_data = df[df['Type'] == test_type]
-                        avg_val = safe_mean(test_data[metric])
-                        unit = test_config['units'].get(metric, '')
-                        
-                        female_norm_text = ""
-                        if 'female_norms' in test_config and metric in test_config['female_norms']:
-                            norm_data = test_config['female_norms'][metric]
-                            female_norm_text = f"<br>Female Norm: {norm_data['mean']:.2f} ± {norm_data['std']:.2f}"
-                        
-                        best_text = ""
-                        if best_val is not None:
-                            best_text = f"<br>Personal Best: {best_val:.2f}{unit}"
-                            if best_date != "N/A":
-                                best_text += f" ({best_date})"
-                        
-                        st.markdown(f"""
-                        <div class="metric-card">
-                            <div class="metric-label">{metric}</div>
-                            <div class="highlight-metric">{format_value(player_val, unit)}</div>
-                            <div class="comparison-text">
-                                Team Average: {format_value(avg_val, unit)}{best_text}{female_norm_text}
-                            </div>
+            for i, metric in enumerate(test_config['highlight']):
+                with highlight_cols[i]:
+                    player_val, _ = lookup_latest_value(summary, selected_name, test_type, metric)
+                    best_val, best_date = lookup_best_value(summary, selected_name, test_type, metric)
+                    avg_val = lookup_team_mean(summary, test_type, metric)
+                    unit = test_config['units'].get(metric, '')
+                    
+                    # 選手が対象の設定規準セットごとの規準値とZ/Tスコア
+                    norm_text = ""
+                    for norm_set in summary['norms']['sets']:
+                        norm_data = test_config.get(f'{norm_set}_norms', {}).get(metric)
+                        if norm_data is None or not is_norm_set_member(summary['norms'], norm_set, selected_name):
+                            continue
+                        norm_text += f"<br>{NORM_SET_LABELS.get(norm_set, norm_set)} Norm: {norm_data['mean']:.2f} ± {norm_data['std']:.2f}"
+                        z_score = lookup_norm_score(summary['norms'], norm_set, selected_name, test_type, metric, player_val)
+                        if z_score is not None:
+                            norm_text += f" (z = {z_score:+.2f}, T = {z_to_t_score(z_score):.0f})"
+                    
+                    best_text = ""
+                    if best_val is not None:
+                        best_text = f"<br>Personal Best: {format_value(best_val, unit)}"
+                        if best_date != "N/A":
+                            best_text += f" ({best_date})"
+                    
+                    st.markdown(f"""
+                    <div class="metric-card">
+                        <div class="metric-label">{metric}</div>
+                        <div class="highlight-metric">{format_value(player_val, unit)}</div>
+                        <div class="comparison-text">
+                            Team Average: {format_value(avg_val, unit)}{best_text}{norm_text}
                         </div>
-                        """, unsafe_allow_html=True)
+                    </div>
+                    """, unsafe_allow_html=True)
+        
+        # Detailed data table
+        st.markdown("### Detailed Data")
+        available_metrics = [m for m in test_config['metrics'] if m in df.columns]
+        
+        if available_metrics:
+            comparison_df = create_comparison_table(
+                summary, selected_name, available_metrics, test_type, config, trends
+            )
+            st.dataframe(comparison_df, use_container_width=True, hide_index=True)
             
-            # Detailed data table
-            st.markdown("### Detailed Data")
-            available_metrics = [m for m in test_config['metrics'] if m in df.columns]
+            # メトリクス選択とトレンドグラフ
+            st.markdown("### Progress Chart")
             
-            if available_metrics:
-                comparison_df = create_comparison_table(
-                    test_player_data, df, available_metrics, test_type, config
-                )
-                st.dataframe(comparison_df, use_container_width=True, hide_index=True)
-                
-                # メトリクス選択とトレンドグラフ
-                st.markdown("### Progress Chart")
-                
-                # グラフ表示するメトリクスを選択
-                selected_metrics = st.multiselect(
-                    f"Select metrics to display for {test_type}",
-                    available_metrics,
-                    default=available_metrics[:3] if len(available_metrics) >= 3 else available_metrics,
-                    key=f"metrics_{test_type}_{selected_name}"
-                )
-                
-                if selected_metrics and PLOTLY_AVAILABLE:
-                    try:
+            # グラフ表示するメトリクスを選択
+            selected_metrics = st.multiselect(
+                f"Select metrics to display for {test_type}",
+                available_metrics,
+                default=available_metrics[:3] if len(available_metrics) >= 3 else available_metrics,
+                key=f"metrics_{test_type}_{selected_name}"
+            )
+            show_trends = st.checkbox(
+                f"Show trend overlays ({TREND_COLUMNS['chronic']}, {TREND_COLUMNS['ewma']})",
+                key=f"trends_{test_type}_{selected_name}"
+            )
+            
+            if selected_metrics and PLOTLY_AVAILABLE:
+                try:
+                    with perf_span('progress_chart', test_type=test_type, metrics=len(selected_metrics)):
                         # サブプロット作成
                         rows = (len(selected_metrics) + 1) // 2
                         cols = min(2, len(selected_metrics))
@@ -1074,22 +951,31 @@ def main():
                             horizontal_spacing=0.15
                         )
                         
-                        for i, metric in enumerate(selected_metrics):
-                            row = (i // 2) + 1
-                            col = (i % 2) + 1
-                            
+                        # データを準備（長い時系列は間引き、点数が多い場合はWebGLで描画）
+                        chart_series = {}
+                        for metric in selected_metrics:
                             if metric in test_player_data.columns:
-                                # データを準備
                                 chart_data = test_player_data[['Date', metric]].dropna()
                                 chart_data['Date'] = pd.to_datetime(chart_data['Date'])
                                 chart_data = chart_data.sort_values('Date')
+                                chart_series[metric] = downsample_series(chart_data['Date'].to_numpy(), chart_data[metric].to_numpy())
+                        
+                        total_points = sum(len(values) for _, values in chart_series.values())
+                        trace_type = scatter_trace_type(total_points)
+                        
+                        for i, metric in enumerate(selected_metrics):
+                            row = (i // 2) + 1
+                            col = (i % 2) + 1
+                            
+                            if metric in chart_series:
+                                dates, values = chart_series[metric]
                                 
-                                if not chart_data.empty:
+                                if len(values) > 0:
                                     # グラフを追加
-                                    mode = 'lines+markers' if len(chart_data) > 1 else 'markers'
-                                    fig.add_trace(go.Scatter(
-                                        x=chart_data['Date'],
-                                        y=chart_data[metric],
+                                    mode = 'lines+markers' if len(values) > 1 else 'markers'
+                                    fig.add_trace(trace_type(
+                                        x=dates,
+                                        y=values,
                                         mode=mode,
                                         name=metric,
                                         line=dict(color='#2D3748', width=3),
@@ -1097,6 +983,12 @@ def main():
                                         showlegend=False
                                     ), row=row, col=col)
                                     
+                                    # 移動平均・EWMAの重ね描き
+                                    trend_data = trend_series(trends, selected_name, test_type, metric) if show_trends else None
+                                    if trend_data is not None:
+                                        for trace in trend_overlay_traces(trend_data, trace_type, '#DC2626', metric):
+                                            fig.add_trace(trace, row=row, col=col)
+                                    
                                     # 軸ラベル設定
                                     unit = test_config['units'].get(metric, '')
                                     fig.update_yaxes(title_text=unit, row=row, col=col)
@@ -1108,142 +1000,330 @@ def main():
                             height=400 * rows,
                             showlegend=False
                         )
-                        
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.success(f"Chart created successfully for {len(selected_metrics)} metrics!")
                     
-                    except Exception as e:
-                        st.error(f"Chart creation failed: {str(e)}")
-                        import traceback
-                        st.code(traceback.format_exc())
+                    with perf_span('st.plotly_chart', chart='progress'):
+                        st.plotly_chart(fig, use_container_width=True)
+                    st.success(f"Chart created successfully for {len(selected_metrics)} metrics!")
                 
-                elif not selected_metrics:
-                    st.info("Please select at least one metric to display.")
-                else:
-                    st.error("Plotly not available for chart creation.")
+                except Exception as e:
+                    st.error(f"Chart creation failed: {str(e)}")
+                    import traceback
+                    st.code(traceback.format_exc())
+            
+            elif not selected_metrics:
+                st.info("Please select at least one metric to display.")
             else:
-                st.info(f"No {test_type} data available.")
-        
-        # レポート生成セクション
-        st.markdown("---")
-        st.markdown('<div class="report-section">', unsafe_allow_html=True)
-        st.markdown("### 📊 Individual Performance Report")
+                st.error("Plotly not available for chart creation.")
+        else:
+            st.info(f"No {test_type} data available.")
+    
+    # レポート生成セクション
+    st.markdown("---")
+    st.markdown('<div class="report-section">', unsafe_allow_html=True)
+    st.markdown("### 📊 Individual Performance Report")
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.markdown("""
+        **Generate comprehensive A4 report including:**
+        - Individual performance summary and trends
+        - Team comparison and benchmarks
+        - Key metrics: Jump Height, mRSI, Braking RFD, Relative Peak Force
+        """)
+    
+    with col2:
+        render_report_download(dataset_key, player_data, df, selected_name, summary)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+def render_team_page(dataset_key, df, summary, config):
+    """チーム分析ページを表示"""
+    st.markdown('<div class="section-header">Team Analysis</div>', unsafe_allow_html=True)
+    
+    # 選手選択
+    st.markdown("### Select Athletes for Comparison")
+    available_names = get_athlete_names(dataset_key, df)
+    selected_athletes = st.multiselect(
+        "Choose athletes to compare",
+        available_names,
+        default=available_names[:3] if len(available_names) >= 3 else available_names,
+        help="Select multiple athletes to compare their performance trends"
+    )
+    show_trends = st.checkbox(f"Overlay {TREND_COLUMNS['ewma']} trend lines", key="team_trends")
+    
+    if selected_athletes:
+        st.success(f"Selected {len(selected_athletes)} athletes: {', '.join(selected_athletes)}")
         
-        col1, col2 = st.columns([2, 1])
+        # テストタイプごとの比較グラフ（選手の組み合わせごとにキャッシュ、色は名前順で固定）
+        athletes = tuple(sorted(selected_athletes))
+        for test_type, test_config in config.items():
+            # そのテストタイプのデータが存在するかチェック
+            if not any((athlete, test_type) in summary['athlete_types'] for athlete in athletes):
+                continue
+            
+            st.markdown(f'<div class="section-header">{test_config["name"]} ({test_type}) Comparison</div>', unsafe_allow_html=True)
+            
+            # 比較グラフを作成
+            comparison_fig = get_team_comparison_chart(dataset_key, test_type, athletes, show_trends, df, config)
+            
+            if comparison_fig:
+                with perf_span('st.plotly_chart', chart='team', test_type=test_type):
+                    st.plotly_chart(comparison_fig, use_container_width=True, config={'displayModeBar': False})
+            else:
+                st.info(f"No sufficient data for {test_type} comparison chart.")
+    
+    else:
+        st.warning("Please select at least one athlete for comparison.")
+    
+    # 全選手の一括レポート生成
+    st.markdown('<div class="report-section">', unsafe_allow_html=True)
+    st.markdown("### 📚 Batch Performance Reports")
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        batch_format = st.radio(
+            "Output format",
+            ["ZIP (one PDF per athlete)", "Merged PDF"] if PYPDF_AVAILABLE else ["ZIP (one PDF per athlete)"],
+            horizontal=True,
+            help="Reports for the whole roster are rendered in parallel worker processes"
+        )
+    
+    with col2:
+        if st.button("📄 Generate All Reports", use_container_width=True):
+            output_format = 'zip' if batch_format.startswith('ZIP') else 'pdf'
+            progress = st.progress(0.0, text="Starting report workers...")
+            
+            def update_progress(completed, total, name):
+                progress.progress(completed / total, text=f"Rendered {completed}/{total}: {name}")
+            
+            try:
+                report_stats = {}
+                batch_data = generate_batch_reports(df, output_format=output_format, summary=summary,
+                                                    progress_callback=update_progress, report_stats=report_stats)
+                
+                st.download_button(
+                    label="📥 Download Reports",
+                    data=batch_data,
+                    file_name=report_file_name('Team', 'zip' if output_format == 'zip' else 'pdf'),
+                    mime="application/zip" if output_format == 'zip' else "application/pdf",
+                    use_container_width=True
+                )
+                st.success("✅ Batch reports generated successfully!")
+                st.caption(format_batch_report_stats(report_stats))
+                
+            except Exception as e:
+                st.error(f"Batch report generation failed: {str(e)}")
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # ロースター全体のリーダーボード（全選手×全メトリクスを一括計算）
+    st.markdown("### Roster Leaderboard")
+    roster = get_roster_table(dataset_key, summary, config)
+    if roster.empty:
+        st.info("No valid data for the roster leaderboard.")
+    else:
+        value_columns = [column for column in roster.columns if column not in ('Name', 'Type', 'Metric', 'Test Date', 'Best Date')]
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.markdown("""
-            **Generate comprehensive A4 report including:**
-            - Individual performance summary and trends
-            - Team comparison and benchmarks
-            - Key metrics: Jump Height, mRSI, Braking RFD, Relative Peak Force
-            """)
-        
+            leaderboard_type = st.selectbox(
+                "Test",
+                list(dict.fromkeys(roster['Type'])),
+                format_func=lambda test_type: f"{config[test_type]['name']} ({test_type})",
+                key="leaderboard_type"
+            )
         with col2:
-            if st.button("📄 Generate PDF Report", type="primary", use_container_width=True):
-                try:
-                    with st.spinner("Generating PDF report..."):
-                        pdf_data = generate_pdf_report(player_data, df, selected_name)
-                    
-                    st.download_button(
-                        label="📥 Download Report",
-                        data=pdf_data,
-                        file_name=f"Performance_Report_{selected_name}_{datetime.now().strftime('%Y%m%d')}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
-                    st.success("✅ Report generated successfully!")
-                    
-                except Exception as e:
-                    st.error(f"Report generation failed: {str(e)}")
-                    st.info("Please ensure matplotlib and seaborn are installed")
+            leaderboard_value = st.selectbox("Value", value_columns, key="leaderboard_value")
         
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Team Analysis Page
-    elif page == "Team Analysis":
-        st.markdown('<div class="section-header">Team Analysis</div>', unsafe_allow_html=True)
+        leaderboard = pivot_roster_table(roster, leaderboard_type, leaderboard_value)
+        with col3:
+            rank_by = st.selectbox("Rank by", list(leaderboard.columns), key="leaderboard_rank")
         
-        # 選手選択
-        st.markdown("### Select Athletes for Comparison")
-        available_names = df['Name'].dropna().unique()
-        selected_athletes = st.multiselect(
-            "Choose athletes to compare",
-            available_names,
-            default=available_names[:3] if len(available_names) >= 3 else available_names,
-            help="Select multiple athletes to compare their performance trends"
+        # 値が小さいほど良いメトリクスは、向きを揃えていない列では昇順に並べる
+        ascending = (leaderboard_type, rank_by) in LOWER_IS_BETTER and leaderboard_value not in ROSTER_ORIENTED_COLUMNS
+        leaderboard = leaderboard.sort_values(rank_by, ascending=ascending, na_position='last')
+        st.dataframe(
+            leaderboard,
+            use_container_width=True,
+            column_config={metric: st.column_config.NumberColumn(format="%.2f") for metric in leaderboard.columns}
+        )
+        st.download_button(
+            label="📥 Download Leaderboard CSV",
+            data=get_roster_csv(dataset_key, roster),
+            file_name=f"Roster_Leaderboard_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv",
+            use_container_width=True
         )
+    
+    # 基本チーム統計（データセットごとに一度だけ集計）
+    st.markdown("### Team Statistics")
+    overview = get_dataset_overview(dataset_key, df)
+    test_types = [test_type for test_type in config if overview['type_counts'].get(test_type)]
+    cols = st.columns(2 + len(test_types))
+    with cols[0]:
+        st.metric("Total Athletes", overview['total_athletes'])
+    with cols[1]:
+        st.metric("Total Tests", overview['total_tests'])
+    for col, test_type in zip(cols[2:], test_types):
+        with col:
+            st.metric(f"{test_type} Tests", overview['type_counts'][test_type])
+    
+    # チームと推移の期間の選択（統計・推移は集計キューブから取得）
+    cube = summary['cube']
+    squads = cube_squads(cube)
+    selected_squads = squads
+    if len(squads) > 1:
+        selected_squads = st.multiselect(
+            "Squads",
+            squads,
+            default=squads,
+            key="team_squads",
+            help=f"Squads from the '{CUBE_SQUAD_COLUMN}' column (athletes without one are grouped as '{CUBE_ALL_SQUADS}')"
+        )
+        if not selected_squads:
+            st.info("Select at least one squad to show team statistics.")
+            return
+    squads_key = tuple(selected_squads) if len(selected_squads) < len(squads) else None
+    granularity = st.radio(
+        "Team trend period",
+        list(CUBE_PERIODS),
+        index=list(CUBE_PERIODS).index('month'),
+        format_func=CUBE_PERIOD_LABELS.get,
+        horizontal=True,
+        key="team_trend_period"
+    )
+    
+    # 各テストタイプの統計
+    team_statistics = get_team_statistics(dataset_key, squads_key, df, config, cube)
+    for test_type, test_config in config.items():
+        if not overview['type_counts'].get(test_type):
+            continue
         
-        if selected_athletes:
-            st.success(f"Selected {len(selected_athletes)} athletes: {', '.join(selected_athletes)}")
-            
-            # CMJとIMTPの比較グラフ
-            for test_type, test_config in config.items():
-                # そのテストタイプのデータが存在するかチェック
-                test_data = df[(df['Type'] == test_type) & (df['Name'].isin(selected_athletes))]
-                
-                if test_data.empty:
-                    continue
-                
-                st.markdown(f'<div class="section-header">{test_config["name"]} ({test_type}) Comparison</div>', unsafe_allow_html=True)
-                
-                # 比較グラフを作成
-                comparison_fig = create_team_comparison_chart(df, selected_athletes, test_type, config)
-                
-                if comparison_fig:
-                    st.plotly_chart(comparison_fig, use_container_width=True, config={'displayModeBar': False})
-                else:
-                    st.info(f"No sufficient data for {test_type} comparison chart.")
+        st.markdown(f"#### {test_config['name']} ({test_type}) Statistics")
         
+        stats_df = team_statistics[test_type]
+        if not stats_df.empty:
+            st.dataframe(stats_df, use_container_width=True, hide_index=True)
         else:
-            st.warning("Please select at least one athlete for comparison.")
+            st.info(f"No valid data for {test_type} statistics.")
         
-        # 基本チーム統計
-        st.markdown("### Team Statistics")
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            total_athletes = len(df['Name'].unique())
-            st.metric("Total Athletes", total_athletes)
-        with col2:
-            total_tests = len(df)
-            st.metric("Total Tests", total_tests)
-        with col3:
-            cmj_total = len(df[df['Type'] == 'CMJ'])
-            st.metric("CMJ Tests", cmj_total)
-        with col4:
-            imtp_total = len(df[df['Type'] == 'IMTP'])
-            st.metric("IMTP Tests", imtp_total)
+        trend_fig = get_team_trend_chart(dataset_key, test_type, granularity, squads_key, cube, config)
+        if trend_fig is not None:
+            with st.expander(f"{test_config['name']} {CUBE_PERIOD_LABELS[granularity]} Team Trend"):
+                with perf_span('st.plotly_chart', chart='team_trend', test_type=test_type):
+                    st.plotly_chart(trend_fig, use_container_width=True)
+
+def main():
+    configure_page()
+    
+    if not PLOTLY_AVAILABLE:
+        st.warning("Plotly library not found. Graph functionality will be disabled.")
+    
+    # 性能計測（デバッグ表示が有効な場合のみ）
+    perf_debug = perf_debug_requested()
+    if perf_debug:
+        start_perf_recording(trace_memory=st.session_state.get('perf_trace_memory', False))
+    
+    # Header
+    st.markdown('<div class="main-header">Fencing Performance Test</div>', 
+                unsafe_allow_html=True)
+    
+    # Page navigation
+    st.markdown('<div class="page-nav">', unsafe_allow_html=True)
+    page = st.selectbox(
+        "Select Analysis Type",
+        ["Individual Analysis", "Team Analysis"],
+        help="Choose between individual athlete analysis or team performance trends"
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # File upload
+    uploaded_files = st.file_uploader(
+        "Upload your performance data files",
+        type=['xlsx', 'xls'],
+        accept_multiple_files=True,
+        help=f"Upload one or more Excel files (e.g. one per season or squad) with any of the sheets {list(DATA_SHEETS)}"
+    )
+    
+    if not uploaded_files:
+        st.info("Please upload a data file to begin analysis.")
+        sheet_list = ", ".join(f"'{sheet_name}'" for sheet_name in DATA_SHEETS)
+        st.markdown(f"""
+        ### Expected Data Format:
+        Excel files with one or more of the sheets: {sheet_list} (multiple files are merged into one dataset)
         
-        # 各テストタイプの統計
-        for test_type, test_config in config.items():
-            test_data = df[df['Type'] == test_type]
-            
-            if test_data.empty:
-                continue
-            
-            st.markdown(f"#### {test_config['name']} ({test_type}) Statistics")
-            
-            # 各メトリクスの統計を計算
-            stats_data = []
-            for metric in test_config['metrics']:
-                if metric in test_data.columns:
-                    metric_data = pd.to_numeric(test_data[metric], errors='coerce').dropna()
-                    metric_data = metric_data[metric_data != 0]
-                    
-                    if len(metric_data) > 0:
-                        stats_data.append({
-                            'Metric': metric,
-                            'Count': len(metric_data),
-                            'Mean': f"{metric_data.mean():.2f}",
-                            'Std Dev': f"{metric_data.std():.2f}",
-                            'Min': f"{metric_data.min():.2f}",
-                            'Max': f"{metric_data.max():.2f}"
-                        })
-            
-            if stats_data:
-                stats_df = pd.DataFrame(stats_data)
-                st.dataframe(stats_df, use_container_width=True, hide_index=True)
-            else:
-                st.info(f"No valid data for {test_type} statistics.")
+        Each sheet should have:
+        - Column A: ID
+        - Column B: Name
+        - Column C: Date
+        - Remaining columns: Test metrics
+        - Optional: Sex, Age Group, Weapon (selects the norm sets applied to each athlete)
+        - Optional: Squad (filters the team statistics and trends)
+        """)
+        st.stop()
+    
+    # Load data using manual method
+    st.info("Loading data...")
+    
+    try:
+        # ファイルのハッシュをキーにキャッシュ済みデータを取得
+        files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+        dataset_hash = compute_dataset_hash(files)
+        with perf_span('load_performance_data', files=len(files)):
+            df, load_info = load_performance_data(dataset_hash, files)
+        
+        if df is None:
+            st.error("Failed to load Excel file")
+            for message in load_info.get('errors', []):
+                st.error(message)
+            st.stop()
+        
+        if df.empty:
+            st.error("No valid data found")
+            st.stop()
+        
+        # デバッグ情報：日付の範囲を表示
+        date_range = get_dataset_overview(dataset_hash, df)['date_range']
+        if date_range is not None:
+            st.success(f"✅ Data loaded! Date range: {date_range[0].strftime('%Y-%m-%d')} to {date_range[1].strftime('%Y-%m-%d')}")
+        if load_info.get('dropped_trials'):
+            st.caption(f"Duplicate trials removed (best trial kept per athlete/date/test): {load_info['dropped_trials']}")
+        if load_info.get('coercion_failures'):
+            st.warning(f"Unparseable values set to missing: {format_coercion_failures(load_info['coercion_failures'])}")
+        if len(load_info.get('sources', [])) > 1:
+            st.caption(f"Merged {len(load_info['sources'])} files: {', '.join(load_info['sources'])}")
+        if load_info.get('cross_file_sessions'):
+            st.warning(format_cross_file_sessions(load_info))
+        
+    except Exception as e:
+        st.error(f"Error processing data: {str(e)}")
+        import traceback
+        st.code(traceback.format_exc())
+        st.stop()
+    
+    # Test configuration
+    config = get_test_config()
+    
+    # 選手別サマリー（データセットごとに一度だけ集計）
+    with perf_span('get_summary_index'):
+        summary = get_summary_index(dataset_hash, df)
+    
+    # 追加セッションの差分取り込み
+    dataset_key, df, summary = append_session_data(dataset_hash, df, summary, load_info)
+    
+    # 選択されたページのみ計算・表示
+    with perf_span('render_page', page=page):
+        if page == "Individual Analysis":
+            render_individual_page(dataset_key, df, summary, config)
+        elif page == "Team Analysis":
+            render_team_page(dataset_key, df, summary, config)
+    
+    if perf_debug:
+        render_perf_panel(stop_perf_recording())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # streamlit run ではアプリ、python で直接実行した場合はコマンドラインとして動作
+    if st.runtime.exists():
+        main()
+    else:
+        from fencing_cli import run_cli
+        sys.exit(run_cli())
\ No newline at end of file
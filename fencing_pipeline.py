@@ -0,0 +1,2004 @@
+"""Fencing Performance Test のデータ処理パイプライン
+
+ワークブックの読み込み・正規化・重複処理・サマリー・規準値・集計キューブ・レポート描画をまとめたモジュール。
+Streamlit・Plotlyを読み込まないため、Webアプリ・コマンドライン・ワーカープロセスから共通で利用できる。
+"""
+import pandas as pd
+import numpy as np
+from datetime import datetime
+import openpyxl
+import contextlib
+import copy
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import multiprocessing
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+# レポート生成用ライブラリ（pyplotは読み込まずFigureを直接作成）
+import matplotlib
+import matplotlib.style
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.layout_engine import TightLayoutEngine
+from matplotlib.ticker import AutoLocator, ScalarFormatter
+
+import fencing_workers
+
+# Parquet（pyarrow）が利用可能かチェック
+try:
+    import pyarrow
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# 結合PDF（pypdf）が利用可能かチェック
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# プロセスの最大メモリ使用量（resource）が利用可能かチェック
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# テストの登録情報（シート名・メトリクス・単位・値が小さいほど良いメトリクス・重複処理の基準・規準値・レポート項目）
+TEST_REGISTRY = {
+    'CMJ': {
+        'name': 'Counter Movement Jump',
+        'sheet': 'CMJ',
+        'metrics': [
+            'Jump Height(cm)',
+            'Countermovement Depth', 
+            'Braking RFD',
+            'Avg. Braking Force',
+            'Avg. Propulsive Force',
+            'mRSI'
+        ],
+        'units': {
+            'Jump Height(cm)': 'cm',
+            'Countermovement Depth': 'm',
+            'Braking RFD': 'N/s',
+            'Avg. Braking Force': 'N',
+            'Avg. Propulsive Force': 'N',
+            'mRSI': ''
+        },
+        'highlight': ['Jump Height(cm)', 'mRSI', 'Avg. Propulsive Force'],
+        'dedup_metric': 'Jump Height(cm)',
+        'female_norms': {
+            'Jump Height(cm)': {'mean': 33.65, 'std': 4.28},
+            'mRSI': {'mean': 0.47, 'std': 0.08},
+            'Braking RFD': {'mean': 6594.37, 'std': 1858.18}
+        },
+        'male_norms': {
+            'Jump Height(cm)': {'mean': 45.12, 'std': 5.36},
+            'mRSI': {'mean': 0.60, 'std': 0.10},
+            'Braking RFD': {'mean': 8912.54, 'std': 2417.33}
+        },
+        'report_metrics': ['Jump Height(cm)', 'mRSI', 'Braking RFD'],
+        'report_colors': {
+            'Jump Height(cm)': '#2D3748',
+            'mRSI': '#DC2626',
+            'Braking RFD': '#059669'
+        }
+    },
+    'IMTP': {
+        'name': 'Isometric Mid-Thigh Pull',
+        'sheet': 'IMTP',
+        'metrics': [
+            'Peak Force',
+            'Relative Peak Force (BW)',
+            'RFD 0-50 ms',
+            'RFD 0-100 ms',
+            'RFD 0-150 ms',
+            'RFD 0-200 ms',
+            'RFD 0-250 ms'
+        ],
+        'units': {
+            'Peak Force': 'N',
+            'Relative Peak Force (BW)': 'BW',
+            'RFD 0-50 ms': 'N/s',
+            'RFD 0-100 ms': 'N/s',
+            'RFD 0-150 ms': 'N/s',
+            'RFD 0-200 ms': 'N/s',
+            'RFD 0-250 ms': 'N/s'
+        },
+        'highlight': ['Peak Force', 'Relative Peak Force (BW)', 'RFD 0-100 ms'],
+        'dedup_metric': 'Relative Peak Force (BW)',
+        'female_norms': {
+            'Relative Peak Force (BW)': {'mean': 42.45, 'std': 7.21},
+            'RFD 0-250 ms': {'mean': 102.43, 'std': 23.89}
+        },
+        'male_norms': {
+            'Relative Peak Force (BW)': {'mean': 45.86, 'std': 7.94},
+            'RFD 0-250 ms': {'mean': 126.71, 'std': 29.52}
+        },
+        'report_metrics': ['Relative Peak Force (BW)'],
+        'report_colors': {
+            'Relative Peak Force (BW)': '#7C3AED'
+        }
+    },
+    'SJ': {
+        'name': 'Squat Jump',
+        'sheet': 'SJ',
+        'metrics': [
+            'Jump Height(cm)',
+            'Peak Power',
+            'Peak Power / BM',
+            'Concentric Peak Force'
+        ],
+        'units': {
+            'Jump Height(cm)': 'cm',
+            'Peak Power': 'W',
+            'Peak Power / BM': 'W/kg',
+            'Concentric Peak Force': 'N'
+        },
+        'highlight': ['Jump Height(cm)', 'Peak Power / BM'],
+        'dedup_metric': 'Jump Height(cm)'
+    },
+    'DJ': {
+        'name': 'Drop Jump',
+        'sheet': 'DJ',
+        'metrics': [
+            'RSI',
+            'Jump Height(cm)',
+            'Contact Time',
+            'Peak Landing Force'
+        ],
+        'units': {
+            'RSI': '',
+            'Jump Height(cm)': 'cm',
+            'Contact Time': 's',
+            'Peak Landing Force': 'N'
+        },
+        'highlight': ['RSI', 'Jump Height(cm)', 'Contact Time'],
+        'lower_is_better': ['Contact Time'],
+        'dedup_metric': 'RSI'
+    },
+    '10/5 Hop': {
+        'name': '10/5 Repeated Hop Test',
+        'sheet': '10-5 Hop',
+        'metrics': [
+            'RSI',
+            'Jump Height(cm)',
+            'Contact Time'
+        ],
+        'units': {
+            'RSI': '',
+            'Jump Height(cm)': 'cm',
+            'Contact Time': 's'
+        },
+        'highlight': ['RSI', 'Contact Time'],
+        'lower_is_better': ['Contact Time'],
+        'dedup_metric': 'RSI'
+    },
+    'Lunge': {
+        'name': 'Fencing Lunge',
+        'sheet': 'Lunge',
+        'metrics': [
+            'Peak Force',
+            'Relative Peak Force (BW)',
+            'Time to Peak Force',
+            'Impulse'
+        ],
+        'units': {
+            'Peak Force': 'N',
+            'Relative Peak Force (BW)': 'BW',
+            'Time to Peak Force': 's',
+            'Impulse': 'N s'
+        },
+        'highlight': ['Peak Force', 'Time to Peak Force'],
+        'lower_is_better': ['Time to Peak Force'],
+        'dedup_metric': 'Peak Force'
+    }
+}
+
+# レポート用の変数設定（登録情報のレポート項目から作成）
+REPORT_METRICS = {
+    test_type: test_info['report_metrics'] for test_type, test_info in TEST_REGISTRY.items() if test_info.get('report_metrics')
+}
+
+# レポートの推移グラフ（表示順）と色・単位
+REPORT_GRAPH_METRICS = [metric for metrics in REPORT_METRICS.values() for metric in metrics]
+REPORT_METRIC_COLORS = {
+    metric: color for test_type in REPORT_METRICS for metric, color in TEST_REGISTRY[test_type]['report_colors'].items()
+}
+REPORT_METRIC_UNITS = {
+    metric: TEST_REGISTRY[test_type]['units'].get(metric, '') for test_type, metrics in REPORT_METRICS.items() for metric in metrics
+}
+
+# レポートのバージョン（レイアウト・出力設定を変更したら上げ、生成済みレポートのキャッシュを無効化）
+REPORT_VERSION = 2
+
+# レポートの出力形式（MIMEタイプ）
+REPORT_FORMATS = {'pdf': 'application/pdf', 'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# 出力プロファイル（compact: TrueTypeフォントのサブセットを埋め込みサイズ優先、fast: Type 3フォントで速度優先）
+# 線・表・文字はどちらもベクターのまま保存し、SVGの文字はパスに変換しない
+REPORT_OUTPUT_PROFILES = {
+    'compact': {'pdf.fonttype': 42, 'svg.fonttype': 'none'},
+    'fast': {'pdf.fonttype': 3, 'svg.fonttype': 'none'}
+}
+REPORT_DEFAULT_PROFILE = 'compact'
+
+# ラスター出力（PNG、ベクター形式内の画像要素）の解像度と上限
+REPORT_RASTER_DPI = 150
+REPORT_MAX_DPI = 300
+
+# 正規化済みデータセットのディスクキャッシュ（元ファイルのハッシュ単位で保存）
+DATASET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.dataset_cache')
+DATASET_CACHE_VERSION = 7
+
+# 正規化済みデータセットに影響する登録情報（シート名・メトリクス・重複処理の基準・値の向き）のハッシュ
+# （登録情報を変更した場合は別のキャッシュとして扱う）
+REGISTRY_HASH = hashlib.sha256(json.dumps({
+    test_type: [test_info['sheet'], test_info['metrics'], test_info['dedup_metric'], test_info.get('lower_is_better', [])]
+    for test_type, test_info in TEST_REGISTRY.items()
+}, sort_keys=True).encode()).hexdigest()[:16]
+
+# 重複処理で最良試技を選ぶ基準メトリクス
+DEDUP_KEY_METRICS = {test_type: test_info['dedup_metric'] for test_type, test_info in TEST_REGISTRY.items()}
+
+# 値が小さいほど良い (テストタイプ, メトリクス)（それ以外は大きいほど良い）
+LOWER_IS_BETTER = {
+    (test_type, metric) for test_type, test_info in TEST_REGISTRY.items() for metric in test_info.get('lower_is_better', [])
+}
+
+# 登録された全メトリクス（試技の同一判定は読み込んだ列によらず全メトリクスで行う）
+REGISTRY_METRICS = list(dict.fromkeys(metric for test_info in TEST_REGISTRY.values() for metric in test_info['metrics']))
+
+# 読み込むシート名 -> テストタイプ
+DATA_SHEETS = {test_info['sheet']: test_type for test_type, test_info in TEST_REGISTRY.items()}
+
+# ストリーミング読み込み時のチャンク行数
+ROW_CHUNK_SIZE = 5000
+
+# トレンド分析の時間ウィンドウ（直近・慢性期の移動平均、傾きを求める直近期間）とEWMAの半減期
+TREND_WINDOWS = {'acute': '7D', 'chronic': '28D', 'slope': '90D'}
+TREND_EWMA_HALFLIFE = '14D'
+TREND_COLUMNS = {
+    'acute': '7d Mean',
+    'chronic': '28d Mean',
+    'acwr': '7d:28d Ratio',
+    'ewma': 'EWMA',
+    'slope': 'Trend (/week)'
+}
+
+# 規準値セットの表示名（設定の '<名前>_norms' と、データから求めるコホート規準）
+NORM_SET_LABELS = {'female': 'Female Fencer', 'male': 'Male Fencer', 'team': 'Team'}
+COHORT_NORM_SET = 'team'
+
+# 選手の属性列（シートにあれば読み込み、選手ごとに最後に記録された値を使う）
+ATHLETE_ATTRIBUTE_COLUMNS = ['Sex', 'Age Group', 'Weapon']
+
+# 設定の規準セットを適用する選手の属性（属性列 -> 該当する値、大文字小文字は区別しない）
+# 定義のない規準セットは全選手に適用し、属性が一致しない・不明な選手の規準スコアは欠損値
+NORM_SET_ATTRIBUTES = {
+    'female': {'Sex': ('F', 'Female', 'W', 'Women')},
+    'male': {'Sex': ('M', 'Male', 'Men')}
+}
+
+# チーム集計キューブの期間の種類（週・月・四半期）と、チーム（スカッド）の列（列がない・空欄の行は全員を1チームとして扱う）
+CUBE_PERIODS = {'week': 'W', 'month': 'M', 'quarter': 'Q'}
+CUBE_PERIOD_LABELS = {'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly'}
+CUBE_KEYS = ['Granularity', 'Type', 'Metric', 'Period', 'Squad']
+CUBE_SQUAD_COLUMN = 'Squad'
+CUBE_ALL_SQUADS = 'All'
+
+# 性能計測（計測開始したスレッドのみ記録し、それ以外では何もしない）
+class _PerfLocal(threading.local):
+    """スレッドごとの計測状態（未計測のスレッドでもrecordingを例外なしで参照できるよう既定値を持つ）"""
+    recording = None
+
+_PERF_LOCAL = _PerfLocal()
+_NULL_SPAN = contextlib.nullcontext()
+
+def start_perf_recording(trace_memory=False):
+    """現在のスレッド（Streamlitでは実行中のセッション）で計測を開始"""
+    # 前回の計測が途中で終わっていれば破棄
+    stop_perf_recording()
+    
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+    
+    _PERF_LOCAL.recording = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'origin': time.perf_counter(),
+        'thread': threading.get_ident(),
+        'trace_memory': trace_memory,
+        'started_tracing': started_tracing,
+        'depth': 0,
+        'spans': []
+    }
+
+def stop_perf_recording():
+    """計測を終了し、スパン・名前ごとの合計・メモリ使用量を返す（計測中でなければNone）"""
+    recording = _PERF_LOCAL.recording
+    if recording is None:
+        return None
+    _PERF_LOCAL.recording = None
+    
+    result = {
+        'started': recording['started'],
+        'total_seconds': time.perf_counter() - recording['origin'],
+        'pid': os.getpid(),
+        'thread': recording['thread'],
+        'spans': recording['spans'],
+        'totals': perf_totals(recording['spans']),
+        'peak_traced_mb': None,
+        'max_rss_mb': None
+    }
+    if recording['trace_memory'] and tracemalloc.is_tracing():
+        result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        if recording['started_tracing']:
+            tracemalloc.stop()
+    if RESOURCE_AVAILABLE:
+        # Linuxではキロバイト単位
+        result['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+@contextlib.contextmanager
+def _record_span(recording, name, args):
+    """スパンの開始・終了時刻（とメモリ増減）を記録"""
+    memory_start = tracemalloc.get_traced_memory()[0] if recording['trace_memory'] else None
+    depth = recording['depth']
+    recording['depth'] = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span = {
+            'name': name,
+            'start': start - recording['origin'],
+            'duration': time.perf_counter() - start,
+            'depth': depth,
+            'args': args
+        }
+        if memory_start is not None:
+            span['memory_delta_mb'] = (tracemalloc.get_traced_memory()[0] - memory_start) / 1e6
+        recording['depth'] = depth
+        recording['spans'].append(span)
+
+def perf_span(name, **args):
+    """処理区間の計測（計測中でなければ何もしないコンテキストを返す）"""
+    recording = _PERF_LOCAL.recording
+    if recording is None:
+        return _NULL_SPAN
+    return _record_span(recording, name, args)
+
+def perf_traced(func):
+    """関数全体をスパンとして計測するデコレーター（計測中でなければそのまま呼び出す）"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        recording = _PERF_LOCAL.recording
+        if recording is None:
+            return func(*args, **kwargs)
+        with _record_span(recording, func.__name__, {}):
+            return func(*args, **kwargs)
+    return wrapper
+
+def perf_totals(spans):
+    """スパン名ごとの回数・合計時間（長い順）"""
+    totals = {}
+    for span in spans:
+        entry = totals.setdefault(span['name'], {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        entry['count'] += 1
+        entry['total_seconds'] += span['duration']
+        entry['max_seconds'] = max(entry['max_seconds'], span['duration'])
+    return dict(sorted(totals.items(), key=lambda item: item[1]['total_seconds'], reverse=True))
+
+def perf_to_json(recording):
+    """計測結果をJSON文字列に変換"""
+    return json.dumps(recording, indent=2, default=str)
+
+def perf_to_chrome_trace(recording):
+    """計測結果をChromeのトレース形式（chrome://tracing・Perfettoで表示可能）に変換"""
+    events = [
+        {
+            'name': span['name'],
+            'ph': 'X',
+            'ts': span['start'] * 1e6,
+            'dur': span['duration'] * 1e6,
+            'pid': recording['pid'],
+            'tid': recording['thread'],
+            'args': {key: str(value) for key, value in span['args'].items()}
+        }
+        for span in recording['spans']
+    ]
+    return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+# Excelシリアル番号の基準日（1900年基準、うるう年バグ分の2日を補正）
+EXCEL_EPOCH = pd.Timestamp('1900-01-01')
+EXCEL_SERIAL_RANGE = (-81182, 132319)  # pandasのTimestampで表現可能な範囲
+DATETIME_DTYPE = pd.Series([EXCEL_EPOCH.to_pydatetime()]).dtype  # datetimeリストから推論される型
+
+def convert_date_values(values):
+    """日付列を一括でdatetimeに変換"""
+    values = pd.Series(values, dtype=object)
+    converted = pd.Series(pd.NaT, index=values.index, dtype=DATETIME_DTYPE)
+    
+    # 値の種類ごとにマスクを作成
+    is_datetime = values.map(lambda v: hasattr(v, 'date')).astype(bool)
+    is_serial = ~is_datetime & values.map(lambda v: isinstance(v, (int, float))).astype(bool)
+    is_text = ~is_datetime & ~is_serial & values.notna()
+    
+    if is_datetime.any():
+        # すでにdatetimeオブジェクトの場合
+        converted[is_datetime] = pd.to_datetime(values[is_datetime], errors='coerce')
+    
+    if is_serial.any():
+        # Excelのシリアル番号の場合（範囲外はNaT）
+        serials = values[is_serial].astype(float)
+        serials = serials.where(serials.between(*EXCEL_SERIAL_RANGE))
+        converted[is_serial] = EXCEL_EPOCH + pd.to_timedelta(serials - 2, unit='D')
+    
+    if is_text.any():
+        # その他の場合は文字列として解析
+        converted[is_text] = pd.to_datetime(values[is_text].astype(str), errors='coerce', format='mixed')
+    
+    return converted
+
+def iter_row_chunks(sheet, chunk_size=None):
+    """シートの行をチャンク単位で順次読み込む"""
+    chunk_size = chunk_size or ROW_CHUNK_SIZE
+    rows = []
+    for row in sheet.iter_rows(values_only=True):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def rows_to_array(rows, width):
+    """行タプルを列幅を揃えたオブジェクト配列に変換し、空行を除去"""
+    full_width = max(width, max(len(row) for row in rows))
+    values = np.empty((len(rows), full_width), dtype=object)
+    for i, row in enumerate(rows):
+        values[i, :len(row)] = row
+    
+    # 空行をスキップ
+    return values[np.not_equal(values, None).any(axis=1), :width]
+
+def sheet_to_dataframe(sheet, chunk_size=None):
+    """シートをDataFrameに変換（行をチャンク単位で列バッファに格納）"""
+    headers = None
+    keep = []
+    buffers = []
+    
+    for rows in iter_row_chunks(sheet, chunk_size):
+        if headers is None:
+            # 最初の空でない行をヘッダーとする
+            first = next((i for i, row in enumerate(rows) if any(cell is not None for cell in row)), None)
+            if first is None:
+                continue
+            headers = rows[first]
+            keep = [i for i, header in enumerate(headers) if header is not None]
+            rows = rows[first + 1:]
+        
+        if rows:
+            # ヘッダーのある列のみ保持
+            buffers.append(rows_to_array(rows, len(headers))[:, keep])
+    
+    if not buffers:
+        return pd.DataFrame()
+    
+    body = np.concatenate(buffers)
+    if len(body) == 0:
+        return pd.DataFrame()
+    
+    # 列ごとに一括で作成
+    df_data = {}
+    for j, i in enumerate(keep):
+        # 型変換はnormalize_schemaでまとめて行う
+        df_data[str(headers[i])] = body[:, j].tolist()
+    
+    # pandasのDataFrameに変換
+    return pd.DataFrame(df_data)
+
+@perf_traced
+def read_workbook_sheets(file_content):
+    """ワークブックを一度だけ開き、登録されたテストのシートを全て読み込む（テストタイプ -> DataFrame、データ行のないシートは除く）"""
+    # openpyxlの読み取り専用モードで開く（セルオブジェクトを全て構築せずに行を順次読み込む）
+    wb = openpyxl.load_workbook(BytesIO(file_content), read_only=True, data_only=True, keep_links=False)
+    try:
+        data_dict = {}
+        for sheet_name, test_type in DATA_SHEETS.items():
+            if sheet_name not in wb.sheetnames:
+                continue
+            df = sheet_to_dataframe(wb[sheet_name])
+            if df.empty:
+                # テンプレートの未使用シート（空・ヘッダーのみ）は読み込まない
+                continue
+            df['Type'] = test_type
+            data_dict[test_type] = df
+        return data_dict
+    finally:
+        wb.close()
+
+def create_dataframe_from_dict(data_dict):
+    """辞書からDataFrameを作成"""
+    dfs = []
+    
+    for sheet_name, df in data_dict.items():
+        # 空行を除去
+        df = df.dropna(subset=['Name'])
+        
+        dfs.append(df)
+    
+    if dfs:
+        # 結合
+        return pd.concat(dfs, ignore_index=True, sort=False)
+    
+    return pd.DataFrame()
+
+@perf_traced
+def deduplicate_trials(df, key_metrics=None):
+    """同日の複数試技から基準メトリクスが最良（通常は最大）の試技のみを残し、除外した試技数とともに返す
+    （同値の場合は行順で最初の試技、つまり複数ファイルでは先に指定したファイルの試技を残す）"""
+    key_metrics = key_metrics or DEDUP_KEY_METRICS
+    df = df.reset_index(drop=True)
+    types = df['Type'].to_numpy(dtype=object)
+    
+    # 各行のテスト種別に対応する基準メトリクスの値を一つの配列にまとめる
+    key_columns = [metric for metric in dict.fromkeys(key_metrics.values()) if metric in df.columns]
+    column_of_type = {test_type: key_columns.index(metric) for test_type, metric in key_metrics.items() if metric in key_columns}
+    positions = pd.Series(types).map(column_of_type).to_numpy(dtype=float)
+    has_column = ~np.isnan(positions)
+    
+    key = np.full(len(df), np.nan)
+    if key_columns:
+        values = df[key_columns].to_numpy(dtype=float)
+        key[has_column] = values[np.flatnonzero(has_column), positions[has_column].astype(int)]
+    valid = ~np.isnan(key)
+    
+    # 値が小さいほど良い基準メトリクスは符号を反転して最大値を選ぶ
+    key[np.isin(types, [test_type for test_type, metric in key_metrics.items() if (test_type, metric) in LOWER_IS_BETTER])] *= -1
+    
+    # 有効な基準値を持つテスト種別のみ重複処理の対象（基準値のない試技は除外）
+    managed = np.isin(types, list(set(types[valid])))
+    
+    # 選手・日付・テストごとに基準値が最大の試技を一度のgroupbyで選択
+    best_rows = pd.Series(key[valid]).groupby(
+        [types[valid], df['Name'].to_numpy()[valid], df['Date'].to_numpy()[valid]],
+        dropna=False, sort=False
+    ).idxmax()
+    
+    keep = ~managed
+    keep[np.flatnonzero(valid)[best_rows.to_numpy()]] = True
+    
+    return df[keep].reset_index(drop=True), int(len(df) - keep.sum())
+
+def read_trials(file_content):
+    """ワークブックから重複処理前の全試技を読み込む"""
+    # 登録されたテストのシートを読み込み（1つもなければNone）
+    data_dict = read_workbook_sheets(file_content)
+    
+    if not data_dict:
+        return None
+    
+    # DataFrameを作成
+    return create_dataframe_from_dict(data_dict)
+
+def check_sheet_schemas(workbooks):
+    """同じテストのメトリクス列がファイル間で一致しているか確認し、問題点の一覧を返す"""
+    config = get_test_config()
+    problems = []
+    references = {}
+    
+    for source, data_dict in workbooks.items():
+        for test_type, df in data_dict.items():
+            sheet_name = config[test_type]['sheet']
+            if 'Name' not in df.columns:
+                problems.append(f"{source} [{sheet_name}]: 'Name' column not found")
+            
+            # 最初のファイルの列構成を基準に比較
+            columns = set(df.columns) & set(config[test_type]['metrics'])
+            reference_source, expected = references.setdefault(test_type, (source, columns))
+            if columns != expected:
+                problems.append(
+                    f"{source} [{sheet_name}] does not match {reference_source}: "
+                    f"missing {sorted(expected - columns)}, unexpected {sorted(columns - expected)}"
+                )
+    
+    return problems
+
+@perf_traced
+def parse_performance_files(files, max_workers=None):
+    """複数のワークブックを並列に読み込み、スキーマを確認して1つの重複処理済みデータセットに結合"""
+    # 複数ファイルの場合はファイル単位でプロセスプールに分散（spawnで起動）
+    max_workers = min(max_workers or os.cpu_count() or 1, len(files))
+    try:
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = {source: executor.submit(fencing_workers.read_workbook_worker, content) for source, content in files}
+                workbooks = {source: future.result() for source, future in futures.items()}
+        else:
+            workbooks = {source: read_workbook_sheets(content) for source, content in files}
+    except Exception as e:
+        return None, {'errors': [f"Excel loading error: {str(e)}"]}
+    
+    # 必要なシートがないファイルとスキーマの不一致を確認
+    errors = [f"{source}: no data found in any of the sheets {list(DATA_SHEETS)}" for source, data_dict in workbooks.items() if not data_dict]
+    errors += check_sheet_schemas(workbooks)
+    if errors:
+        return None, {'errors': errors}
+    
+    sheets = {}
+    for source, data_dict in workbooks.items():
+        for test_type, df in data_dict.items():
+            df['Source'] = source
+            sheets[(source, test_type)] = df
+    
+    # DataFrameを作成（ファイルをまたいだ同日の試技も重複処理し、重なったセッションは読み込み情報で報告）
+    df = create_dataframe_from_dict(sheets)
+    if df.empty:
+        return df, {}
+    
+    # 型付けしてから重複処理（日付の表記揺れを揃えて同日の試技を判定）
+    df, coercion_failures = normalize_schema(df)
+    # 差分取り込みで既知の試技を判定できるよう、重複処理前の全試技のハッシュを保持
+    raw_hashes = trial_hashes(df)
+    overlaps = cross_file_sessions(df)
+    df, dropped_trials = deduplicate_trials(df)
+    return df, {
+        'dropped_trials': dropped_trials,
+        'coercion_failures': coercion_failures,
+        'sources': [source for source, _ in files],
+        'cross_file_sessions': len(overlaps),
+        'cross_file_kept': count_kept_sources(df, overlaps),
+        'trial_hashes': raw_hashes
+    }
+
+def cross_file_sessions(df):
+    """複数のファイルに試技があるセッション（Type, Name, Date）の一覧
+    （同名の選手が別のファイルにいる場合も1つのセッションとして重複処理されるため、読み込み情報で報告する）"""
+    sources = df.groupby(['Type', 'Name', 'Date'], observed=True, dropna=False, sort=False)['Source'].nunique()
+    return sources.index[sources.to_numpy() > 1]
+
+def count_kept_sources(df, sessions):
+    """指定したセッションについて、重複処理後に残った試技のファイル別件数"""
+    if len(sessions) == 0:
+        return {}
+    kept = pd.MultiIndex.from_frame(df[['Type', 'Name', 'Date']]).isin(sessions)
+    return {source: int(count) for source, count in df.loc[kept, 'Source'].astype(str).value_counts(sort=False).items()}
+
+def format_cross_file_sessions(load_info):
+    """複数のファイルにまたがるセッションの件数と、残した試技のファイルを表示用の文字列にする"""
+    kept = ', '.join(f"{source}: {count}" for source, count in load_info['cross_file_kept'].items())
+    return (f"{load_info['cross_file_sessions']} athlete/date/test sessions appear in more than one file; "
+            f"the best trial was kept (ties: first file). Kept trials by file: {kept}")
+
+def format_coercion_failures(failures):
+    """変換できなかった値の数を表示用の文字列にする"""
+    return ', '.join(f"{column}: {count}" for column, count in failures.items())
+
+def has_raw_value(values):
+    """変換前の値が入力されているか（None・NaN・空文字以外）"""
+    return values.notna() & ~values.map(lambda v: isinstance(v, str) and not v.strip()).astype(bool)
+
+@perf_traced
+def normalize_schema(df):
+    """スキーマを強制して列を型付けし、変換できなかった値の数を列ごとに返す
+    （Name/Type/Sourceはcategory、Dateはdatetime64、メトリクスはfloat32、チーム・選手の属性は文字列）"""
+    df = df.copy()
+    metrics = {metric for test_config in get_test_config().values() for metric in test_config['metrics']}
+    failures = {}
+    
+    for col in df.columns:
+        values = df[col]
+        if col in ('Name', 'Type', 'Source'):
+            df[col] = values.astype(str).astype('category')
+            continue
+        elif str(col).lower() == 'date':
+            if pd.api.types.is_datetime64_any_dtype(values):
+                continue
+            converted = pd.Series(convert_date_values(values.to_numpy(dtype=object)).to_numpy(), index=df.index)
+        elif col == CUBE_SQUAD_COLUMN or col in ATHLETE_ATTRIBUTE_COLUMNS:
+            # チーム・選手の属性は数字でも文字列として保持（空欄は欠損値）
+            df[col] = values.astype('string').str.strip().replace('', pd.NA)
+            continue
+        elif col in metrics:
+            if pd.api.types.is_numeric_dtype(values):
+                df[col] = values.astype('float32')
+                continue
+            converted = pd.to_numeric(values, errors='coerce').astype('float32')
+        else:
+            if values.dtype == object:
+                # その他の列は数値化できれば数値、できなければ文字列として保持
+                try:
+                    df[col] = pd.to_numeric(values)
+                except (ValueError, TypeError):
+                    df[col] = values.astype('string')
+            continue
+        
+        # 入力があったのに変換できなかった値を数える
+        failed = int((has_raw_value(values) & converted.isna()).sum())
+        if failed:
+            failures[col] = failed
+        df[col] = converted
+    
+    return df, failures
+
+def compute_file_hash(file_content):
+    """ファイル内容のハッシュを計算"""
+    return hashlib.sha256(file_content).hexdigest()
+
+def compute_dataset_hash(files):
+    """ファイル名と内容のハッシュから、複数ファイルのデータセットのハッシュを計算"""
+    return hashlib.sha256('|'.join(f"{source}:{compute_file_hash(content)}" for source, content in files).encode()).hexdigest()
+
+def dataset_cache_paths(file_hash):
+    """ディスクキャッシュのデータファイル・試技ハッシュ・メタデータのパスを返す"""
+    base = os.path.join(DATASET_CACHE_DIR, f"{file_hash}.v{DATASET_CACHE_VERSION}.{REGISTRY_HASH}")
+    return f"{base}.parquet", f"{base}.hashes.npy", f"{base}.json"
+
+@perf_traced
+def read_dataset_cache(file_hash):
+    """有効なディスクキャッシュがあれば読み込む"""
+    if not PARQUET_AVAILABLE:
+        return None
+    
+    paths = dataset_cache_paths(file_hash)
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    data_path, hashes_path, meta_path = paths
+    
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if (meta.get('source_hash') != file_hash or meta.get('version') != DATASET_CACHE_VERSION
+                or meta.get('registry_hash') != REGISTRY_HASH):
+            return None
+        load_info = meta.get('load_info', {})
+        load_info['trial_hashes'] = np.load(hashes_path)
+        return pd.read_parquet(data_path), load_info
+    except Exception:
+        return None
+
+@perf_traced
+def write_dataset_cache(file_hash, df, load_info):
+    """正規化済みデータセットをディスクキャッシュに保存"""
+    if not PARQUET_AVAILABLE:
+        return
+    
+    data_path, hashes_path, meta_path = dataset_cache_paths(file_hash)
+    meta = {
+        'source_hash': file_hash,
+        'version': DATASET_CACHE_VERSION,
+        'registry_hash': REGISTRY_HASH,
+        'rows': len(df),
+        'load_info': {key: value for key, value in load_info.items() if key != 'trial_hashes'},
+        'created': datetime.now().isoformat(timespec='seconds')
+    }
+    
+    try:
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+        # 他セッションと競合しないよう一時ファイルに書いてから置き換える
+        for path, write in [(data_path, lambda f: df.to_parquet(f, index=False)),
+                            (hashes_path, lambda f: np.save(f, load_info['trial_hashes'])),
+                            (meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))]:
+            fd, tmp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+    except Exception:
+        # キャッシュ保存に失敗しても読み込み自体は継続する
+        pass
+
+def load_dataset(files, dataset_hash=None):
+    """ディスクキャッシュを優先して (ファイル名, 内容) のリストからデータセットと読み込み情報を読み込む"""
+    dataset_hash = dataset_hash or compute_dataset_hash(files)
+    
+    cached = read_dataset_cache(dataset_hash)
+    if cached is not None:
+        return cached
+    
+    df, load_info = parse_performance_files(files)
+    if df is not None and not df.empty:
+        write_dataset_cache(dataset_hash, df, load_info)
+    
+    return df, load_info
+
+def trial_hashes(df, metrics=None):
+    """試技の同一判定用ハッシュ（Name, Date, Type と登録された全メトリクスの値、ない列は欠損値）"""
+    frame = pd.DataFrame({
+        'Name': df['Name'].astype(str),
+        'Date': df['Date'].astype('datetime64[ns]'),
+        'Type': df['Type'].astype(str)
+    }, index=df.index)
+    for metric in metrics or REGISTRY_METRICS:
+        frame[metric] = df[metric].astype(float) if metric in df.columns else np.nan
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+def build_ingest_index(df, hashes=None):
+    """差分取り込み用の索引（既知の試技ハッシュと、セッション -> 最良試技の行ラベル）を作成（読み込み時の全試技のハッシュがあればそれを使う）"""
+    return {
+        'hashes': set((trial_hashes(df) if hashes is None else hashes).tolist()),
+        'sessions': dict(zip(zip(df['Type'], df['Name'], df['Date']), df.index))
+    }
+
+def align_categories(frames, columns=('Name', 'Type', 'Source')):
+    """結合前にカテゴリ列のカテゴリを揃える（結合後もcategory型を保つ）"""
+    for col in columns:
+        if not all(col in frame.columns for frame in frames):
+            continue
+        categories = pd.Index([])
+        for frame in frames:
+            categories = categories.union(pd.Index(frame[col].astype('category').cat.categories), sort=False)
+        for frame in frames:
+            frame[col] = frame[col].astype(pd.CategoricalDtype(categories))
+    return frames
+
+@perf_traced
+def ingest_incremental(df, summary, new_trials, ingest_index=None):
+    """新しい試技のみを既存データセットに追加し、重複処理とサマリーを差分更新（索引はその場で更新）"""
+    if ingest_index is None:
+        ingest_index = build_ingest_index(df)
+    
+    # 既に取り込み済みの試技（と差分内の重複）を除外
+    # 既存データ・差分ファイルの一方にしかないシートの列は欠損値で補う
+    new_trials = new_trials.reindex(columns=df.columns.union(new_trials.columns, sort=False))
+    new_trials, coercion_failures = normalize_schema(new_trials.dropna(subset=['Name']))
+    hashes = trial_hashes(new_trials)
+    is_new = np.fromiter((h not in ingest_index['hashes'] for h in hashes.tolist()), dtype=bool, count=len(hashes))
+    is_new &= ~pd.Series(hashes).duplicated().to_numpy()
+    ingest_index['hashes'].update(hashes[is_new].tolist())
+    candidates = new_trials[is_new].copy()
+    
+    # 基準メトリクスのないテストの試技は重複処理の対象外、基準値のない試技は除外
+    key_metrics = {test_type: metric for test_type, metric in DEDUP_KEY_METRICS.items() if metric in new_trials.columns}
+    candidate_keys = pd.Series(np.nan, index=candidates.index)
+    for test_type, metric in key_metrics.items():
+        mask = candidates['Type'] == test_type
+        candidate_keys[mask] = candidates.loc[mask, metric].to_numpy(dtype=float)
+    managed = candidates['Type'].isin(list(key_metrics)).to_numpy()
+    candidates = candidates[~managed | candidate_keys.notna().to_numpy()]
+    
+    report = {
+        'new_rows': int(is_new.sum()),
+        'duplicates_skipped': int(len(new_trials) - is_new.sum()),
+        'added': 0,
+        'replaced': 0,
+        'dropped_trials': int(is_new.sum()),
+        'coercion_failures': coercion_failures
+    }
+    if candidates.empty:
+        return df, summary, ingest_index, report
+    
+    # 同じセッション（Type, Name, Date）の現在の最良試技と合わせて重複処理
+    sessions = ingest_index['sessions']
+    existing_labels = list(dict.fromkeys(
+        label for label in (sessions.get(key) for key in zip(candidates['Type'], candidates['Name'], candidates['Date'])
+                            if key[0] in key_metrics)
+        if label is not None
+    ))
+    existing = df.loc[existing_labels].copy()
+    existing['_label'] = existing.index.to_numpy(dtype=float)
+    candidates['_label'] = np.nan
+    
+    existing, candidates = align_categories([existing, candidates])
+    winners, _ = deduplicate_trials(pd.concat([existing, candidates], ignore_index=True))
+    
+    removed_labels = sorted(set(existing_labels) - set(winners['_label'].dropna().astype(int)))
+    added_rows = winners[winners['_label'].isna()].drop(columns='_label')
+    start = df.index.max() + 1 if len(df) else 0
+    added_rows.index = pd.RangeIndex(start, start + len(added_rows))
+    removed_rows = df.loc[removed_labels]
+    
+    # 置き換え対象を除いて新しい最良試技を追加（既存の行ラベルは保持、既存データにない列は欠損値）
+    kept, added_rows = align_categories([df.drop(index=removed_labels), added_rows])
+    updated = pd.concat([kept, added_rows])
+    
+    sessions.update(zip(zip(added_rows['Type'], added_rows['Name'], added_rows['Date']), added_rows.index))
+    
+    report.update({
+        'added': int(len(added_rows) - len(removed_labels)),
+        'replaced': len(removed_labels),
+        'dropped_trials': int(report['new_rows'] - len(added_rows))
+    })
+    
+    return updated, update_summary_index(summary, updated, removed_rows, added_rows), ingest_index, report
+
+def get_test_config():
+    """Test configuration"""
+    return copy.deepcopy(TEST_REGISTRY)
+
+def higher_is_better(types, metrics):
+    """(テストタイプ, メトリクス)ごとに値が大きいほど良いかの配列（登録情報の lower_is_better 以外は大きいほど良い）"""
+    keys = pd.MultiIndex.from_arrays([pd.Index(types, dtype=object), pd.Index(metrics, dtype=object)])
+    return ~keys.isin(list(LOWER_IS_BETTER))
+
+def melt_metric_values(df, metrics, id_columns=('Name', 'Type')):
+    """メトリクス列を縦持ち（Name, Type, Date, Metric, Value）に変換し、有効な値（数値・非ゼロ）のみ残す（ない列は除く）"""
+    metrics = [metric for metric in metrics if metric in df.columns]
+    base = df[list(id_columns) + metrics].copy()
+    base['Date'] = df['Date'] if 'Date' in df.columns else pd.NaT
+    long = base.melt(id_vars=list(id_columns) + ['Date'], value_vars=metrics, var_name='Metric', value_name='Value')
+    long['Value'] = long['Value'].astype(float)
+    long = long[long['Name'].notna() & np.isfinite(long['Value']) & (long['Value'] != 0)]
+    long['Metric'] = long['Metric'].astype('category')
+    return long
+
+def summarize_athletes(long):
+    """縦持ちデータから選手×テスト×メトリクスごとの最新値・自己ベストを集計"""
+    keys = ['Name', 'Type', 'Metric']
+    
+    # 最新値（日付順の最後、日付のない行は最も古い扱い）
+    latest = long.sort_values('Date', na_position='first', kind='stable').drop_duplicates(keys, keep='last')
+    athletes = latest.set_index(keys)[['Value', 'Date']].rename(columns={'Value': 'latest', 'Date': 'latest_date'})
+    
+    # 自己ベスト（値が小さいほど良いメトリクスは最小値、同値の場合は元の行順で最初）
+    score = long['Value'].where(higher_is_better(long['Type'], long['Metric']), -long['Value'])
+    best = long.loc[long.assign(Score=score).groupby(keys, observed=True, sort=False)['Score'].idxmax()]
+    return athletes.join(best.set_index(keys)[['Value', 'Date']].rename(columns={'Value': 'best', 'Date': 'best_date'}))
+
+def athlete_entry_map(athletes):
+    """選手別集計を (Name, Type, Metric) -> (最新値, 測定日, 自己ベスト, 測定日) の辞書に変換"""
+    latest_dates = athletes['latest_date'].dt.strftime('%Y-%m-%d').fillna("N/A")
+    best_dates = athletes['best_date'].dt.strftime('%Y-%m-%d').fillna("N/A")
+    return dict(zip(athletes.index, zip(athletes['latest'], latest_dates, athletes['best'], best_dates)))
+
+@perf_traced
+def build_summary_index(df, config=None):
+    """選手×テスト×メトリクスごとの最新値・最高値とチーム統計を一括集計"""
+    config = config or get_test_config()
+    metrics = list(dict.fromkeys(
+        metric for test_config in config.values() for metric in test_config['metrics'] if metric in df.columns
+    ))
+    
+    # 縦持ちに変換し、有効な値のみ残す
+    long = melt_metric_values(df, metrics)
+    athletes = summarize_athletes(long)
+    
+    # チーム統計と昇順に並べた値
+    team_sorted = long.sort_values(['Type', 'Metric', 'Value'], kind='stable')
+    team = team_sorted.groupby(['Type', 'Metric'], observed=True, sort=False)['Value'].agg(['sum', 'count'])
+    bounds = np.cumsum(np.r_[0, team['count'].to_numpy()])
+    sorted_values = team_sorted['Value'].to_numpy(dtype=float)
+    
+    return {
+        'metrics': metrics,
+        'athletes': athletes,
+        'athlete_types': set(zip(df['Name'], df['Type'])),
+        'athlete_entries': athlete_entry_map(athletes),
+        'norms': build_norm_table(df, config, metrics),
+        'cube': build_aggregate_cube(df, metrics),
+        'team_entries': {
+            key: {'mean': total / count, 'sum': total, 'count': int(count), 'values': sorted_values[start:end]}
+            for key, total, count, start, end in zip(team.index, team['sum'], team['count'], bounds[:-1], bounds[1:])
+        }
+    }
+
+def update_summary_index(summary, df, removed_rows, added_rows):
+    """追加・削除された行に関係する部分のみサマリーインデックスを差分更新（元のインデックスは変更しない）"""
+    # 追加された行で新しいメトリクスの列が加わった場合も含め、更新後の列から対象を決める
+    metrics = [metric for metric in REGISTRY_METRICS if metric in df.columns]
+    
+    # 選手単位の集計は影響を受けた選手の行のみで再計算
+    affected = set(removed_rows['Name']) | set(added_rows['Name'])
+    old_athletes = summary['athletes']
+    stale = old_athletes.index.get_level_values('Name').isin(affected)
+    recomputed = summarize_athletes(melt_metric_values(df[df['Name'].isin(affected)], metrics))
+    athletes = pd.concat([old_athletes[~stale], recomputed])
+    
+    athlete_entries = dict(summary['athlete_entries'])
+    for key in old_athletes.index[stale]:
+        del athlete_entries[key]
+    athlete_entries.update(athlete_entry_map(recomputed))
+    
+    # チーム統計は削除・追加された値のみ反映
+    team_entries = dict(summary['team_entries'])
+    for rows, sign in [(removed_rows, -1), (added_rows, 1)]:
+        long = melt_metric_values(rows, metrics)
+        for key, values in long.groupby(['Type', 'Metric'], observed=True)['Value']:
+            entry = team_entries.get(key, {'sum': 0.0, 'count': 0, 'values': np.array([])})
+            changed = np.sort(values.to_numpy(dtype=float))
+            positions = np.searchsorted(entry['values'], changed, side='left')
+            if sign < 0:
+                # 同じ値が複数ある場合は連続する位置を削除
+                positions = positions + np.arange(len(changed)) - np.searchsorted(changed, changed, side='left')
+                sorted_values = np.delete(entry['values'], positions)
+            else:
+                sorted_values = np.insert(entry['values'], positions, changed)
+            
+            total = entry['sum'] + sign * changed.sum()
+            count = entry['count'] + sign * len(changed)
+            if count > 0:
+                team_entries[key] = {'mean': total / count, 'sum': total, 'count': count, 'values': sorted_values}
+            else:
+                team_entries.pop(key, None)
+    
+    # 規準値は削除・追加された値のみ反映し、規準セットの対象は影響を受けた選手のみ再判定
+    if summary['norms']['metrics'] == metrics:
+        norms = update_cohort_norms(update_cohort_norms(summary['norms'], removed_rows, -1), added_rows)
+        norms = update_norm_members(norms, df, affected)
+    else:
+        norms = build_norm_table(df, metrics=metrics)
+    
+    return {
+        'metrics': metrics,
+        'athletes': athletes,
+        'athlete_types': summary['athlete_types'] | set(zip(added_rows['Name'], added_rows['Type'])),
+        'athlete_entries': athlete_entries,
+        'norms': norms,
+        'cube': update_aggregate_cube(summary['cube'], df, removed_rows, added_rows, metrics),
+        'team_entries': team_entries
+    }
+
+def metric_matrix(rows, metrics):
+    """行×メトリクスの値の行列（数値・非ゼロ以外は欠損値）"""
+    values = np.column_stack([
+        rows[metric].to_numpy(dtype=float) if metric in rows.columns
+        else np.full(len(rows), np.nan)
+        for metric in metrics
+    ]) if metrics else np.empty((len(rows), 0))
+    values[values == 0] = np.nan
+    return values
+
+@perf_traced
+def build_norm_table(df, config=None, metrics=None):
+    """規準値（平均・標準偏差）を (規準セット, テストタイプ, メトリクス) の配列に格納"""
+    config = config or get_test_config()
+    metrics = metrics or list(dict.fromkeys(
+        metric for test_config in config.values() for metric in test_config['metrics'] if metric in df.columns
+    ))
+    types = list(config)
+    config_sets = list(dict.fromkeys(
+        key[:-len('_norms')] for test_config in config.values() for key in test_config if key.endswith('_norms')
+    ))
+    sets = config_sets + [COHORT_NORM_SET]
+    
+    # 設定で与えられた規準値
+    mean = np.full((len(sets), len(types), len(metrics)), np.nan)
+    std = np.full((len(sets), len(types), len(metrics)), np.nan)
+    for i, norm_set in enumerate(config_sets):
+        for j, test_type in enumerate(types):
+            for metric, norm in config[test_type].get(f'{norm_set}_norms', {}).items():
+                if metric in metrics:
+                    mean[i, j, metrics.index(metric)] = norm['mean']
+                    std[i, j, metrics.index(metric)] = norm['std']
+    
+    table = {
+        'sets': sets,
+        'types': types,
+        'metrics': metrics,
+        'members': norm_set_members(df, sets),
+        'mean': mean,
+        'std': std,
+        'count': np.zeros((len(types), len(metrics))),
+        'sum': np.zeros((len(types), len(metrics))),
+        'sumsq': np.zeros((len(types), len(metrics)))
+    }
+    
+    # コホート規準はデータから集計
+    return update_cohort_norms(table, df)
+
+def update_cohort_norms(table, rows, sign=1):
+    """行の追加（sign=1）・削除（sign=-1）に合わせてコホート規準を更新（元の表は変更しない）"""
+    count, total, sumsq = table['count'].copy(), table['sum'].copy(), table['sumsq'].copy()
+    values = metric_matrix(rows, table['metrics'])
+    type_codes = pd.Categorical(rows['Type'], categories=table['types']).codes
+    
+    # 件数・合計・二乗和をテストタイプごとに加減
+    for j in range(len(table['types'])):
+        type_values = values[type_codes == j]
+        count[j] += sign * np.isfinite(type_values).sum(axis=0)
+        total[j] += sign * np.nansum(type_values, axis=0)
+        sumsq[j] += sign * np.nansum(type_values * type_values, axis=0)
+    
+    mean, std = table['mean'].copy(), table['std'].copy()
+    cohort = table['sets'].index(COHORT_NORM_SET)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean[cohort] = np.where(count > 0, total / count, np.nan)
+        std[cohort] = np.where(count > 1, np.sqrt(np.maximum(sumsq - total * total / count, 0) / (count - 1)), np.nan)
+    
+    return dict(table, mean=mean, std=std, count=count, sum=total, sumsq=sumsq)
+
+def athlete_attributes(df):
+    """選手ごとの属性（属性列ごとに最後に記録された値、シートにない列は含めない）"""
+    columns = [column for column in ATHLETE_ATTRIBUTE_COLUMNS if column in df.columns]
+    attributes = df[['Name'] + columns].groupby('Name', observed=True, sort=False)[columns].last()
+    attributes.index = attributes.index.astype(str)
+    return attributes
+
+def norm_set_members(df, norm_sets):
+    """規準セットごとの対象選手の集合（対象の定義がない規準セットは全選手が対象としてNone）"""
+    attributes = athlete_attributes(df)
+    members = {}
+    for norm_set in norm_sets:
+        criteria = NORM_SET_ATTRIBUTES.get(norm_set)
+        if criteria is None:
+            members[norm_set] = None
+            continue
+        
+        match = np.ones(len(attributes), dtype=bool)
+        for column, accepted in criteria.items():
+            if column not in attributes.columns:
+                match[:] = False
+                break
+            values = attributes[column].astype('string').str.strip().str.lower()
+            match &= values.isin([value.lower() for value in accepted]).to_numpy(dtype=bool)
+        members[norm_set] = set(attributes.index[match])
+    return members
+
+def update_norm_members(table, df, names):
+    """指定した選手の規準セットの対象を更新後のデータから再判定（元の表は変更しない）"""
+    names = {str(name) for name in names}
+    changed = norm_set_members(df[df['Name'].astype(str).isin(names)], table['sets'])
+    members = {
+        norm_set: None if current is None else (current - names) | changed[norm_set]
+        for norm_set, current in table['members'].items()
+    }
+    return dict(table, members=members)
+
+def is_norm_set_member(table, norm_set, player_name):
+    """選手が規準セットの対象か"""
+    members = table['members'][norm_set]
+    return members is None or str(player_name) in members
+
+def score_norms(df, table, norm_set):
+    """全行×メトリクスのZスコアを規準セットに対して一括計算"""
+    values = metric_matrix(df, table['metrics'])
+    type_codes = pd.Categorical(df['Type'], categories=table['types']).codes
+    
+    # 規準のないテストタイプ（コード -1）は末尾の欠損値の行を参照
+    i = table['sets'].index(norm_set)
+    missing = np.full((1, len(table['metrics'])), np.nan)
+    mean = np.vstack([table['mean'][i], missing])[type_codes]
+    std = np.vstack([table['std'][i], missing])[type_codes]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (values - mean) / std
+    
+    # 規準セットの対象外の選手の行は欠損値
+    members = table['members'][norm_set]
+    if members is not None:
+        z_scores[~df['Name'].astype(str).isin(members).to_numpy()] = np.nan
+    return pd.DataFrame(z_scores, index=df.index, columns=table['metrics'])
+
+def lookup_norm_score(table, norm_set, player_name, test_type, metric, value):
+    """1つの値のZスコア（規準がない場合・選手が規準セットの対象外の場合はNone）"""
+    if value is None or pd.isna(value) or test_type not in table['types'] or metric not in table['metrics']:
+        return None
+    if not is_norm_set_member(table, norm_set, player_name):
+        return None
+    i, j, k = table['sets'].index(norm_set), table['types'].index(test_type), table['metrics'].index(metric)
+    mean, std = table['mean'][i, j, k], table['std'][i, j, k]
+    if not np.isfinite(mean) or not np.isfinite(std) or std == 0:
+        return None
+    return (float(value) - mean) / std
+
+def z_to_t_score(z_scores):
+    """ZスコアをTスコア（平均50・標準偏差10）に変換"""
+    return 50 + 10 * z_scores
+
+@perf_traced
+def add_norm_score_columns(df, table, norm_sets=None):
+    """規準値のあるメトリクスについて '<メトリクス> Z (<規準>)' と T スコアの列を追加"""
+    result = df.copy()
+    for norm_set in norm_sets or table['sets']:
+        label = NORM_SET_LABELS.get(norm_set, norm_set)
+        z_scores = score_norms(df, table, norm_set)
+        for metric in z_scores.columns[z_scores.notna().any().to_numpy()]:
+            result[f"{metric} Z ({label})"] = z_scores[metric].astype('float32')
+            result[f"{metric} T ({label})"] = z_to_t_score(z_scores[metric]).astype('float32')
+    return result
+
+def squad_labels(df):
+    """行ごとのチーム名（チーム列がない・空欄の行は全員を1チームとして扱う）"""
+    if CUBE_SQUAD_COLUMN not in df.columns:
+        return pd.Series(CUBE_ALL_SQUADS, index=df.index, dtype='string')
+    return df[CUBE_SQUAD_COLUMN].astype('string').fillna(CUBE_ALL_SQUADS)
+
+def cube_values(df, metrics):
+    """キューブ集計用の縦持ちデータ"""
+    df = df.assign(**{CUBE_SQUAD_COLUMN: squad_labels(df)})
+    long = melt_metric_values(df, metrics, ('Name', 'Type', CUBE_SQUAD_COLUMN))
+    return long.rename(columns={CUBE_SQUAD_COLUMN: 'Squad'})
+
+def aggregate_cube_cells(long):
+    """縦持ちデータを (期間の種類, テスト, メトリクス, 期間, チーム) ごとに一度のgroupbyで集計
+    （日付のない値は期間NaTのセルに含め、全期間の統計に反映）"""
+    expanded = pd.concat([
+        long.assign(Granularity=granularity, Period=long['Date'].dt.to_period(freq).dt.start_time)
+        for granularity, freq in CUBE_PERIODS.items()
+    ], ignore_index=True)
+    expanded['Square'] = expanded['Value'] * expanded['Value']
+    
+    return expanded.groupby(CUBE_KEYS, observed=True, dropna=False).agg(
+        count=('Value', 'count'),
+        sum=('Value', 'sum'),
+        sumsq=('Square', 'sum'),
+        min=('Value', 'min'),
+        max=('Value', 'max')
+    )
+
+@perf_traced
+def build_aggregate_cube(df, metrics=None):
+    """チーム集計キューブ（期間の種類×テスト×メトリクス×期間×チームごとの件数・合計・二乗和・最小・最大）を作成"""
+    metrics = metrics or list(dict.fromkeys(
+        metric for test_config in get_test_config().values() for metric in test_config['metrics'] if metric in df.columns
+    ))
+    return aggregate_cube_cells(cube_values(df, metrics)).sort_index()
+
+def update_aggregate_cube(cube, df, removed_rows, added_rows, metrics):
+    """追加された値は加算し、削除された値を含むセルのみ更新後の行から再集計（元のキューブは変更しない）"""
+    added = aggregate_cube_cells(cube_values(added_rows, metrics))
+    index = cube.index.union(added.index)
+    current, extra = cube.reindex(index), added.reindex(index)
+    merged = pd.DataFrame({
+        'count': current['count'].fillna(0) + extra['count'].fillna(0),
+        'sum': current['sum'].fillna(0) + extra['sum'].fillna(0),
+        'sumsq': current['sumsq'].fillna(0) + extra['sumsq'].fillna(0),
+        'min': np.fmin(current['min'], extra['min']),
+        'max': np.fmax(current['max'], extra['max'])
+    }, index=index)
+    merged['count'] = merged['count'].astype(int)
+    
+    # 最小・最大は減算できないため、削除された値を含むセルは同じテスト・チームの行から集計し直す
+    if len(removed_rows):
+        stale = aggregate_cube_cells(cube_values(removed_rows, metrics)).index
+        candidates = df[df['Type'].isin(set(removed_rows['Type']))]
+        candidates = candidates[squad_labels(candidates).isin(set(squad_labels(removed_rows))).to_numpy()]
+        recomputed = aggregate_cube_cells(cube_values(candidates, metrics))
+        merged = pd.concat([merged[~merged.index.isin(stale)], recomputed[recomputed.index.isin(stale)]])
+    
+    return merged.sort_index()
+
+def cube_moments(cells):
+    """件数・合計・二乗和から平均・標準偏差（不偏）を計算"""
+    count, total, sumsq = cells['count'], cells['sum'], cells['sumsq']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(sumsq - total * total / count, 0) / (count - 1))
+    return cells.assign(mean=mean, std=std.where(count > 1))
+
+def cube_period_cells(cube, granularity, squads=None):
+    """期間の種類のセルを取り出し、指定したチーム（Noneは全チーム）で合算"""
+    cells = cube.xs(granularity, level='Granularity')
+    if squads is not None:
+        cells = cells[cells.index.get_level_values('Squad').isin(list(squads))]
+    return cells.groupby(level=['Type', 'Metric', 'Period'], observed=True, dropna=False).agg(
+        {'count': 'sum', 'sum': 'sum', 'sumsq': 'sum', 'min': 'min', 'max': 'max'}
+    )
+
+def cube_team_totals(cube, squads=None):
+    """全期間のテスト×メトリクスごとの件数・平均・標準偏差・最小・最大"""
+    # 期間数が最も少ない四半期のセルを合算
+    cells = cube_period_cells(cube, 'quarter', squads)
+    totals = cells.groupby(level=['Type', 'Metric'], observed=True).agg(
+        {'count': 'sum', 'sum': 'sum', 'sumsq': 'sum', 'min': 'min', 'max': 'max'}
+    )
+    return cube_moments(totals)
+
+def cube_trend(cube, test_type, metric, granularity='month', squads=None):
+    """テスト・メトリクスの期間ごとの件数・平均・標準偏差・最小・最大（日付のない値は除く）"""
+    cells = cube_period_cells(cube, granularity, squads)
+    key = (test_type, metric)
+    if key not in cells.index.droplevel('Period'):
+        return pd.DataFrame(columns=['count', 'sum', 'sumsq', 'min', 'max', 'mean', 'std'])
+    trend = cells.xs(key, level=['Type', 'Metric'])
+    return cube_moments(trend[trend.index.notna()])
+
+def cube_squads(cube):
+    """キューブに含まれるチームの一覧"""
+    return sorted(cube.index.get_level_values('Squad').unique().astype(str))
+
+def lookup_latest_value(summary, name, test_type, metric, default=None):
+    """最新値と測定日を取得"""
+    entry = summary['athlete_entries'].get((name, test_type, metric))
+    if entry is None:
+        return default, "N/A"
+    return float(entry[0]), entry[1]
+
+def lookup_best_value(summary, name, test_type, metric, default=None):
+    """自己ベストと測定日を取得"""
+    entry = summary['athlete_entries'].get((name, test_type, metric))
+    if entry is None:
+        return default, default
+    return float(entry[2]), entry[3]
+
+def lookup_team_mean(summary, test_type, metric):
+    """チーム平均を取得"""
+    entry = summary['team_entries'].get((test_type, metric))
+    return float(entry['mean']) if entry is not None else None
+
+def percentile_rank(summary, test_type, metric, values):
+    """チーム分布に対するパーセンタイル順位（値より悪い値の割合、%）を二分探索で計算"""
+    entry = summary['team_entries'].get((test_type, metric))
+    if entry is None:
+        return None
+    team_values = entry['values']
+    if (test_type, metric) in LOWER_IS_BETTER:
+        # 値が小さいほど良いメトリクスは値より大きい値の割合
+        return (len(team_values) - np.searchsorted(team_values, values, side='right')) / len(team_values) * 100
+    return np.searchsorted(team_values, values, side='left') / len(team_values) * 100
+
+def rank_roster_percentiles(summary):
+    """全選手×全メトリクスの最新値のパーセンタイル順位を一括計算"""
+    athletes = summary['athletes']
+    latest = athletes['latest'].to_numpy(dtype=float)
+    ranks = np.full(len(athletes), np.nan)
+    
+    # (テスト, メトリクス)ごとに全選手分をまとめて検索
+    groups = athletes.groupby(level=['Type', 'Metric'], observed=True, sort=False).indices
+    for (test_type, metric), positions in groups.items():
+        ranks[positions] = percentile_rank(summary, test_type, metric, latest[positions])
+    
+    return pd.Series(ranks, index=athletes.index, name='Percentile')
+
+def add_percentile_columns(df, summary):
+    """全履歴の各試技にチーム分布に対するパーセンタイル列（"<メトリクス> Percentile"）を追加"""
+    result = df.copy()
+    type_positions = df.groupby('Type', observed=True, sort=False).indices
+    
+    for (test_type, metric), entry in summary['team_entries'].items():
+        positions = type_positions.get(test_type)
+        if positions is None:
+            continue
+        
+        column = f"{metric} Percentile"
+        if column not in result.columns:
+            result[column] = np.nan
+        
+        values = df[metric].iloc[positions].to_numpy(dtype=float)
+        ranks = percentile_rank(summary, test_type, metric, values)
+        ranks[~np.isfinite(values) | (values == 0)] = np.nan
+        result.iloc[positions, result.columns.get_loc(column)] = ranks
+    
+    return result
+
+# ロースター表で良い方向を正に揃えた列（他の値の列は値が小さいほど良いメトリクスでは小さい方が上位）
+ROSTER_ORIENTED_COLUMNS = ('Team Delta', 'Team Delta %', 'Percentile')
+
+def norm_score_column(norm_set):
+    """規準セットごとのZスコア列の名前"""
+    return f"Z vs {NORM_SET_LABELS.get(norm_set, norm_set)}"
+
+@perf_traced
+def build_roster_table(summary, config=None):
+    """全選手×全テスト×全メトリクスの最新値・自己ベスト・チーム平均との差・Zスコア・パーセンタイルを一括計算"""
+    config = config or get_test_config()
+    athletes = summary['athletes']
+    names = athletes.index.get_level_values('Name')
+    types = athletes.index.get_level_values('Type')
+    metrics = athletes.index.get_level_values('Metric')
+    latest = athletes['latest'].to_numpy(dtype=float)
+    
+    # チーム平均は (テスト, メトリクス) ごとにまとめて割り当て
+    team_mean = np.full(len(athletes), np.nan)
+    groups = athletes.groupby(level=['Type', 'Metric'], observed=True, sort=False).indices
+    for key, positions in groups.items():
+        entry = summary['team_entries'].get(key)
+        if entry is not None:
+            team_mean[positions] = entry['mean']
+    
+    table = pd.DataFrame({
+        'Name': names.astype(str),
+        'Type': types.astype(str),
+        'Metric': metrics.astype(str),
+        # 表示・出力用の値はfloat32の誤差を除いたfloat64
+        'Latest': widen_float32(latest),
+        'Test Date': athletes['latest_date'].to_numpy(),
+        'Personal Best': widen_float32(athletes['best']),
+        'Best Date': athletes['best_date'].to_numpy(),
+        'Team Average': team_mean
+    })
+    # チーム平均との差は良い方向を正とする（値が小さいほど良いメトリクスは符号を反転）
+    sign = np.where(higher_is_better(types, metrics), 1.0, -1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['Team Delta'] = (latest - team_mean) * sign
+        table['Team Delta %'] = np.where(team_mean != 0, (latest - team_mean) / team_mean * 100 * sign, np.nan)
+    
+    # 規準セットごとのZスコア（規準のないテスト・メトリクス、規準セットの対象外の選手は欠損値）
+    norms = summary['norms']
+    type_codes = pd.Categorical(types, categories=norms['types']).codes
+    metric_codes = pd.Categorical(metrics, categories=norms['metrics']).codes
+    known = (type_codes >= 0) & (metric_codes >= 0)
+    for i, norm_set in enumerate(norms['sets']):
+        mean = np.where(known, norms['mean'][i][type_codes, metric_codes], np.nan)
+        std = np.where(known, norms['std'][i][type_codes, metric_codes], np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = (latest - mean) / std
+        if norms['members'][norm_set] is not None:
+            std = np.where(table['Name'].isin(norms['members'][norm_set]).to_numpy(), std, np.nan)
+        table[norm_score_column(norm_set)] = np.where(np.isfinite(std) & (std != 0), z_scores, np.nan)
+    
+    table['Percentile'] = rank_roster_percentiles(summary).to_numpy()
+    
+    # テストタイプ・メトリクスは設定の順、選手は名前順
+    type_order = pd.Categorical(table['Type'], categories=list(config)).codes
+    metric_order = pd.Categorical(table['Metric'], categories=summary['metrics']).codes
+    order = np.lexsort((table['Name'].to_numpy(), metric_order, type_order))
+    return table.iloc[order].reset_index(drop=True)
+
+def pivot_roster_table(table, test_type, column):
+    """ロースター表の1項目を選手×メトリクスの横持ちに変換（メトリクスは表の順）"""
+    rows = table[table['Type'] == test_type]
+    wide = rows.pivot(index='Name', columns='Metric', values=column)
+    wide.columns.name = None
+    return wide[list(rows['Metric'].unique())]
+
+def roster_table_csv(table, path=None):
+    """ロースター表をCSV（日付はYYYY-MM-DD、数値は小数点以下3桁）に変換（pathを指定した場合はファイルに書き込み）"""
+    return table.to_csv(path, index=False, date_format='%Y-%m-%d', float_format='%.3f')
+
+@perf_traced
+def build_trend_index(df, config=None):
+    """全選手×テスト×メトリクスの移動平均・EWMA・7d:28d比・傾きをグループ単位で一括計算"""
+    config = config or get_test_config()
+    metrics = list(dict.fromkeys(
+        metric for test_config in config.values() for metric in test_config['metrics'] if metric in df.columns
+    ))
+    keys = ['Name', 'Type', 'Metric']
+    
+    # 日付のある有効な値を選手×テスト×メトリクス、日付の順に並べる
+    long = melt_metric_values(df, metrics)
+    long = long[long['Date'].notna()].sort_values(keys + ['Date'], kind='stable').reset_index(drop=True)
+    grouped = long.groupby(keys, observed=True)
+    
+    # 時間ベースの移動平均（各測定日から遡るウィンドウ）とEWMA
+    # （行はグループキーのコード順・日付順に並んでいるため、ソート済みグループの結果の並びは行の順序と一致する。
+    #   sort=Falseではrollingの出力がグループの出現順にならず、同じテスト内のメトリクスが入れ替わることがある）
+    for name in ['acute', 'chronic']:
+        long[name] = grouped.rolling(TREND_WINDOWS[name], on='Date')['Value'].mean().to_numpy()
+    long['ewma'] = grouped['Value'].ewm(halflife=TREND_EWMA_HALFLIFE, times=long['Date']).mean().to_numpy()
+    long['acwr'] = long['acute'] / long['chronic']
+    
+    # 直近期間の最小二乗法による傾き（1週間あたりの変化量）
+    recent = long[long['Date'] >= grouped['Date'].transform('max') - pd.Timedelta(TREND_WINDOWS['slope'])]
+    days = (recent['Date'] - long['Date'].min()).dt.total_seconds() / 86400
+    recent_grouped = recent.assign(x=days).groupby(keys, observed=True, sort=False)
+    x = days - recent_grouped['x'].transform('mean')
+    y = recent['Value'] - recent_grouped['Value'].transform('mean')
+    moments = recent[keys].assign(xy=x * y, xx=x * x).groupby(keys, observed=True, sort=False)[['xy', 'xx']].sum()
+    
+    # 最新の測定日時点の値
+    latest = long.drop_duplicates(keys, keep='last').set_index(keys)[['acute', 'chronic', 'acwr', 'ewma']]
+    latest['slope'] = (moments['xy'] / moments['xx'] * 7).reindex(latest.index)
+    
+    # 各グループの時系列の位置（グラフ重ね描き用）
+    bounds = np.cumsum(np.r_[0, grouped.size().to_numpy()])
+    
+    return {
+        'series': long,
+        'spans': dict(zip(grouped.size().index, zip(bounds[:-1], bounds[1:]))),
+        'latest': latest,
+        'latest_entries': dict(zip(latest.index, latest.to_dict('records')))
+    }
+
+def lookup_trend_values(trends, player_name, test_type, metric):
+    """選手・テスト・メトリクスの最新のトレンド指標（なければNone）"""
+    return trends['latest_entries'].get((player_name, test_type, metric))
+
+def trend_series(trends, player_name, test_type, metric):
+    """選手・テスト・メトリクスの移動平均・EWMAの時系列（なければNone）"""
+    span = trends['spans'].get((player_name, test_type, metric))
+    if span is None:
+        return None
+    return trends['series'].iloc[span[0]:span[1]]
+
+def widen_float32(values):
+    """float32で表せる値は最短の10進表記を経由してfloat64に変換（表示・出力の丸めをfloat32の誤差で変えない、他の値はそのまま）"""
+    values = np.array(values, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        narrow = values.astype(np.float32)
+    exact = narrow == values
+    values[exact] = narrow[exact].astype(str).astype(np.float64)
+    return values
+
+def format_value(value, unit=""):
+    """値を安全にフォーマット（float32の値は10進表記どおりに丸める）"""
+    if value is None or pd.isna(value):
+        return "N/A"
+    try:
+        formatted_val = f"{float(widen_float32(value)):.2f}"
+        return f"{formatted_val}{unit}" if unit else formatted_val
+    except:
+        return "N/A"
+
+# レポート生成関数群
+def create_report_template():
+    """A4レポートの静的レイアウト（図・グリッド・表・グラフ枠）を構築"""
+    matplotlib.style.use('default')
+    
+    # フィギュアサイズをA4に設定 (8.27 x 11.69 inch)
+    fig = Figure(figsize=(8.27, 11.69))
+    
+    # グリッドレイアウト設定: 6行2列（Team部分を下に移動）
+    gs = fig.add_gridspec(6, 2, height_ratios=[0.8, 1, 1, 0.8, 1, 1], hspace=0.7, wspace=0.35)
+    
+    # タイトル（さらに20ポイント下げる）
+    title = fig.suptitle('Performance Report', fontsize=16, fontweight='bold', y=0.955)
+    
+    # 1. 個人の表（Team表と同じ高さに調整）
+    table1 = create_report_table(fig.add_subplot(gs[0, :]), 'Individual Performance Summary', 0.95,
+                                 ['Metric', 'Latest Value', 'Personal Best', 'Test Date'])
+    
+    # 2. 個人の4つの推移グラフ（サイズを統一）
+    positions = [(1, 0), (1, 1), (2, 0), (2, 1)]  # 2x2グリッド
+    individual_graphs = {
+        metric: create_metric_graph_frame(fig.add_subplot(gs[pos]), metric, f'Individual {metric}', individual=True)
+        for metric, pos in zip(REPORT_GRAPH_METRICS, positions)
+    }
+    
+    # 3. チーム比較の表
+    table2 = create_report_table(fig.add_subplot(gs[3, :]), 'Team Average Comparison', 0.98,
+                                 ['Metric', 'Individual', 'Team Average', 'Percentile Rank'])
+    
+    # 4. チームの4つの推移グラフ（サイズを統一）
+    team_positions = [(4, 0), (4, 1), (5, 0), (5, 1)]  # 2x2グリッド
+    team_graphs = {
+        metric: create_metric_graph_frame(fig.add_subplot(gs[pos]), metric, f'Team {metric}', individual=False)
+        for metric, pos in zip(REPORT_GRAPH_METRICS, team_positions)
+    }
+    
+    # 日付情報
+    period_text = fig.text(0.02, 0.005, '', fontsize=8, ha='left')
+    generated_text = fig.text(0.98, 0.005, '', fontsize=8, ha='right')
+    
+    # レイアウトを一度だけ調整（レイアウトエンジンを残さず、保存時の再計算を避ける）
+    TightLayoutEngine().execute(fig)
+    
+    return {
+        'fig': fig,
+        'title': title,
+        'individual_table': table1,
+        'team_table': table2,
+        'individual_graphs': individual_graphs,
+        'team_graphs': team_graphs,
+        'period_text': period_text,
+        'generated_text': generated_text,
+        'team_source': None
+    }
+
+def create_report_table(ax, title, title_y, headers):
+    """レポート用の表の枠を作成（行はREPORT_METRICSのメトリクス分を確保）"""
+    ax.axis('off')
+    ax.text(0.5, title_y, title, fontsize=14, fontweight='bold', ha='center', transform=ax.transAxes)
+    
+    rows = [[metric] + ["N/A"] * (len(headers) - 1) for metrics in REPORT_METRICS.values() for metric in metrics]
+    table = ax.table(cellText=rows,
+                     colLabels=headers,
+                     cellLoc='center',
+                     loc='center',
+                     bbox=[0.03, 0.15, 0.94, 0.75])  # 幅を20ポイント拡大 (0.05→0.03, 0.9→0.94)
+    table.auto_set_font_size(False)
+    table.set_fontsize(7)
+    table.scale(1, 2.2)  # 両表で同じ縦幅スケール
+    
+    # ヘッダーのスタイル設定
+    for i in range(len(headers)):
+        table[(0, i)].set_facecolor('#2D3748')
+        table[(0, i)].set_text_props(weight='bold', color='white')
+    
+    return table
+
+def fill_report_table(table, table_data):
+    """表のセルの文字列のみを差し替える"""
+    rows = {row[0]: row for row in table_data['data']} if table_data else {}
+    metrics = [metric for metrics in REPORT_METRICS.values() for metric in metrics]
+    n_cols = max(col for _, col in table.get_celld()) + 1
+    
+    # データのないメトリクスはN/Aで埋める
+    for r, metric in enumerate(metrics, start=1):
+        row = rows.get(metric, [metric] + ["N/A"] * (n_cols - 1))
+        for c, value in enumerate(row):
+            table[(r, c)].get_text().set_text(value)
+
+def fill_report_template(template, player_data, all_data, player_name, summary=None):
+    """レポートのテンプレートに選手のデータ（表の文字列・線データ・軸範囲）を差し込む"""
+    if summary is None:
+        summary = build_summary_index(all_data)
+    
+    template['title'].set_text(f'Performance Report - {player_name}')
+    
+    # 表
+    fill_report_table(template['individual_table'], create_individual_summary_table(summary, player_name))
+    fill_report_table(template['team_table'], create_team_comparison_summary_table(summary, player_name))
+    
+    # 個人の推移グラフ
+    for metric, graph in template['individual_graphs'].items():
+        update_metric_graph(graph, metric_trend_data(player_data, metric))
+    
+    # チームの推移グラフ（集計キューブから作成、同じキューブなら描き直さない）
+    if template['team_source'] is not summary['cube']:
+        for metric, graph in template['team_graphs'].items():
+            update_metric_graph(graph, team_trend_data(summary['cube'], metric))
+        template['team_source'] = summary['cube']
+    
+    # 日付情報を追加
+    period = ''
+    all_dates = player_data['Date'].dropna()
+    if not all_dates.empty:
+        all_dates = pd.to_datetime(all_dates)
+        period = f"Report Period: {all_dates.min().strftime('%Y-%m-%d')} to {all_dates.max().strftime('%Y-%m-%d')}"
+    template['period_text'].set_text(period)
+    template['generated_text'].set_text(f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}')
+    
+    return template['fig']
+
+def create_individual_summary_table(summary, player_name):
+    """個人サマリーテーブルを作成"""
+    headers = ['Metric', 'Latest Value', 'Personal Best', 'Test Date']
+    data = []
+    
+    for test_type, metrics in REPORT_METRICS.items():
+        if (player_name, test_type) not in summary['athlete_types']:
+            continue
+            
+        for metric in metrics:
+            if metric not in summary['metrics']:
+                continue
+                
+            latest_val, latest_date = lookup_latest_value(summary, player_name, test_type, metric)
+            best_val, best_date = lookup_best_value(summary, player_name, test_type, metric)
+            
+            data.append([
+                metric,
+                format_value(latest_val),
+                format_value(best_val),
+                latest_date
+            ])
+    
+    return {'headers': headers, 'data': data} if data else None
+
+def create_team_comparison_summary_table(summary, player_name):
+    """チーム比較サマリーテーブルを作成"""
+    headers = ['Metric', 'Individual', 'Team Average', 'Percentile Rank']
+    data = []
+    
+    for test_type, metrics in REPORT_METRICS.items():
+        if (player_name, test_type) not in summary['athlete_types']:
+            continue
+            
+        for metric in metrics:
+            if metric not in summary['metrics']:
+                continue
+                
+            player_val, _ = lookup_latest_value(summary, player_name, test_type, metric)
+            team_avg = lookup_team_mean(summary, test_type, metric)
+            
+            # パーセンタイル計算
+            percentile = "N/A"
+            if player_val is not None:
+                percentile_val = percentile_rank(summary, test_type, metric, player_val)
+                if percentile_val is not None:
+                    percentile = f"{percentile_val:.0f}%"
+            
+            data.append([
+                metric,
+                format_value(player_val),
+                format_value(team_avg),
+                percentile
+            ])
+    
+    return {'headers': headers, 'data': data} if data else None
+
+def metric_trend_data(data, metric):
+    """個人の推移グラフ用のデータ（全測定値）を作成（チームはteam_trend_dataで集計キューブから作成）"""
+    for test_type, metrics in REPORT_METRICS.items():
+        if metric not in metrics:
+            continue
+        
+        test_data = data[data['Type'] == test_type]
+        if test_data.empty or metric not in test_data.columns:
+            continue
+        
+        # 有効なデータをフィルター
+        valid_data = test_data.dropna(subset=[metric, 'Date'])
+        valid_data = valid_data[valid_data[metric] != 0]
+        
+        if len(valid_data) < 1:
+            continue
+        
+        valid_data = valid_data.sort_values('Date')
+        return valid_data['Date'].to_numpy(), valid_data[metric].to_numpy()
+    
+    return None
+
+def team_trend_data(cube, metric, granularity='month'):
+    """チームの推移グラフ用のデータ（集計キューブの期間別平均）を作成"""
+    for test_type, metrics in REPORT_METRICS.items():
+        if metric not in metrics:
+            continue
+        
+        trend = cube_trend(cube, test_type, metric, granularity)
+        if trend.empty:
+            continue
+        
+        return trend.index.to_numpy(), trend['mean'].to_numpy()
+    
+    return None
+
+def create_metric_graph_frame(ax, metric, title, individual=True):
+    """推移グラフの枠（タイトル・線・軸書式）を作成"""
+    ax.set_title(title, fontsize=9, fontweight='bold', pad=6)
+    color = REPORT_METRIC_COLORS.get(metric, '#2D3748')
+    
+    if individual:
+        line, = ax.plot([], [], marker='o', linewidth=2.5, markersize=5,
+                        color=color, markerfacecolor='white',
+                        markeredgecolor=color, markeredgewidth=2)
+    else:
+        line, = ax.plot([], [], marker='s', linewidth=2.5, markersize=5,
+                        color=color, linestyle='--', alpha=0.8,
+                        markerfacecolor='white', markeredgecolor=color, markeredgewidth=2)
+    
+    ax.xaxis_date()
+    ax.tick_params(axis='x', rotation=45, labelsize=6)  # X軸文字サイズを6に縮小
+    ax.tick_params(axis='y', labelsize=7)
+    
+    no_data_text = ax.text(0.5, 0.5, 'No data available',
+                           ha='center', va='center', transform=ax.transAxes,
+                           fontsize=8, color='gray', visible=False)
+    
+    return {'ax': ax, 'line': line, 'no_data_text': no_data_text, 'metric': metric}
+
+def update_metric_graph(graph, series):
+    """推移グラフの線データと軸範囲を差し替える"""
+    ax = graph['ax']
+    line = graph['line']
+    
+    if series is None:
+        line.set_data([], [])
+        line.set_visible(False)
+        graph['no_data_text'].set_visible(True)
+        ax.grid(False)
+        ax.set_ylabel('')
+        ax.set_xticks([])
+        ax.set_yticks([])
+        return
+    
+    line.set_data(*series)
+    line.set_visible(True)
+    graph['no_data_text'].set_visible(False)
+    ax.grid(True, alpha=0.3, linewidth=0.5)
+    
+    # X軸の日付フォーマット（より短い形式）
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+    ax.xaxis.set_major_locator(mdates.MonthLocator(interval=3))  # 3ヶ月間隔に変更
+    ax.yaxis.set_major_locator(AutoLocator())
+    ax.yaxis.set_major_formatter(ScalarFormatter())
+    
+    # 軸範囲をデータに合わせる
+    ax.relim()
+    ax.autoscale_view()
+    
+    # Y軸ラベル
+    unit = REPORT_METRIC_UNITS.get(graph['metric'], '')
+    ax.set_ylabel(unit, fontsize=7)
+
+# 再利用するレポートテンプレート（プロセス内で共有、初回のみ構築）
+_REPORT_TEMPLATE = {}
+_REPORT_TEMPLATE_LOCK = threading.Lock()
+
+def get_report_template():
+    """再利用するレポートテンプレートと描画を直列化するロック（全セッション・再実行で共有、初回のみ構築）"""
+    with _REPORT_TEMPLATE_LOCK:
+        if not _REPORT_TEMPLATE:
+            _REPORT_TEMPLATE.update(template=create_report_template(), lock=threading.Lock())
+    return _REPORT_TEMPLATE
+
+def report_save_options(output_format, dpi=None):
+    """保存時の設定（解像度は上限で制限し、作成日時を省いて同じ内容なら同じ出力にする）"""
+    options = {'format': output_format, 'dpi': min(dpi or REPORT_RASTER_DPI, REPORT_MAX_DPI)}
+    if output_format == 'pdf':
+        options['metadata'] = {'CreationDate': None}
+    elif output_format == 'svg':
+        options['metadata'] = {'Date': None}
+    return options
+
+def report_output_stats(output_format, profile, dpi, data, pages, fill_seconds, render_seconds):
+    """出力の統計（描画時間・ページあたりのバイト数）"""
+    return {
+        'format': output_format,
+        'profile': profile,
+        'dpi': dpi,
+        'pages': pages,
+        'bytes': len(data),
+        'bytes_per_page': len(data) / pages if pages else 0,
+        'fill_seconds': fill_seconds,
+        'render_seconds': render_seconds
+    }
+
+@perf_traced
+def render_report(player_data, all_data, player_name, summary=None, output_format='pdf', dpi=None, profile=None):
+    """レポートをPDF・PNG・SVGで描画し、出力データと統計を返す"""
+    profile = profile or REPORT_DEFAULT_PROFILE
+    options = report_save_options(output_format, dpi)
+    buffer = BytesIO()
+    
+    # 共有テンプレートにデータを差し込んで保存
+    report_template = get_report_template()
+    with report_template['lock']:
+        template = report_template['template']
+        start = time.perf_counter()
+        with perf_span('fill_report_template'):
+            fig = fill_report_template(template, player_data, all_data, player_name, summary)
+        filled = time.perf_counter()
+        with perf_span('report_savefig', format=output_format), matplotlib.rc_context(REPORT_OUTPUT_PROFILES[profile]):
+            # 余白を除く範囲は選手名などの内容で変わるため保存ごとに計算
+            fig.savefig(buffer, bbox_inches='tight', **options)
+        finished = time.perf_counter()
+    
+    data = buffer.getvalue()
+    return data, report_output_stats(output_format, profile, options['dpi'], data, 1, filled - start, finished - filled)
+
+def format_report_stats(stats):
+    """出力の統計を表示用の文字列にする"""
+    return (f"{stats['format'].upper()} · {stats['bytes_per_page'] / 1024:.0f} KB/page · "
+            f"rendered in {stats['fill_seconds'] + stats['render_seconds']:.2f}s "
+            f"({stats['profile']}, raster {stats['dpi']} dpi)")
+
+def format_batch_report_stats(report_stats):
+    """一括生成した出力の統計（平均）を表示用の文字列にする"""
+    stats = list(report_stats.values())
+    if not stats:
+        return ""
+    pages = sum(entry['pages'] for entry in stats)
+    bytes_per_page = sum(entry['bytes_per_page'] * entry['pages'] for entry in stats) / pages
+    seconds = sum(entry['fill_seconds'] + entry['render_seconds'] for entry in stats) / len(stats)
+    return (f"{len(stats)} reports · {stats[0]['format'].upper()} · {bytes_per_page / 1024:.0f} KB/page · "
+            f"{seconds:.2f}s per report ({stats[0]['profile']}, raster {stats[0]['dpi']} dpi)")
+
+def generate_pdf_report(player_data, all_data, player_name, summary=None):
+    """PDFレポートを生成してダウンロード可能な形式で返す"""
+    return render_report(player_data, all_data, player_name, summary)[0]
+
+def report_file_name(player_name, extension='pdf'):
+    """レポートのファイル名を作成"""
+    safe_name = re.sub(r'[\\/:*?"<>|]+', '_', str(player_name)).strip()
+    return f"Performance_Report_{safe_name}_{datetime.now().strftime('%Y%m%d')}.{extension}"
+
+@perf_traced
+def generate_batch_reports(all_data, player_names=None, output_format='zip', summary=None,
+                           max_workers=None, progress_callback=None, file_format='pdf', dpi=None, profile=None,
+                           report_stats=None):
+    """全選手の個人レポートを並列プロセスで一括生成（ZIPまたは結合PDF）
+    （ZIPの各ファイルはfile_formatで出力、結合PDFは各ワーカーが描画したページを連結、
+    report_statsを渡すと選手ごとの統計を格納）"""
+    if player_names is None:
+        player_names = all_data['Name'].dropna().unique()
+    player_names = list(player_names)
+    if not player_names:
+        return None
+    
+    if summary is None:
+        summary = build_summary_index(all_data)
+    if output_format != 'zip':
+        if not PYPDF_AVAILABLE:
+            raise ImportError("pypdf is required for merged PDF reports")
+        file_format = 'pdf'
+    
+    # 全コアを使用（spawnで起動し、サーバープロセスの状態を引き継がない）
+    max_workers = min(max_workers or os.cpu_count() or 1, len(player_names))
+    results = {}
+    
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=fencing_workers.init_report_worker,
+                             initargs=(all_data, summary)) as executor:
+        futures = {
+            executor.submit(fencing_workers.render_report_worker, name, file_format, dpi, profile): name
+            for name in player_names
+        }
+        for completed, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            results[name] = future.result()
+            if progress_callback:
+                progress_callback(completed, len(player_names), name)
+    
+    buffer = BytesIO()
+    if output_format == 'zip':
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name in player_names:
+                zf.writestr(report_file_name(name, file_format), results[name][0])
+    else:
+        # 描画済みのページを選手順に連結するのみ
+        writer = PdfWriter()
+        for name in player_names:
+            writer.append(PdfReader(BytesIO(results[name][0])))
+        writer.write(buffer)
+    
+    if report_stats is not None:
+        for name in player_names:
+            report_stats[name] = results[name][1]
+    
+    return buffer.getvalue()
+
+@perf_traced
+def create_comparison_table(summary, player_name, metrics, test_type, config, trends=None):
+    """比較テーブルを作成（トレンド分析結果があれば移動平均・EWMA・傾きの列を追加）"""
+    table_data = []
+    
+    female_norms = config[test_type].get('female_norms', {})
+    
+    for metric in metrics:
+        player_val, measurement_date = lookup_latest_value(summary, player_name, test_type, metric)
+        best_val, best_date = lookup_best_value(summary, player_name, test_type, metric)
+        avg_val = lookup_team_mean(summary, test_type, metric)
+        
+        female_norm_text = "N/A"
+        if metric in female_norms:
+            mean_val = female_norms[metric]['mean']
+            std_val = female_norms[metric]['std']
+            female_norm_text = f"{mean_val:.2f} ± {std_val:.2f}"
+        
+        best_value_text = "N/A"
+        if best_val is not None:
+            best_value_text = format_value(best_val)
+            if best_date != "N/A":
+                best_value_text += f" ({best_date})"
+        
+        table_data.append({
+            'Metric': metric,
+            'Latest Value': format_value(player_val),
+            'Test Date': measurement_date,
+            'Personal Best': best_value_text,
+            'Team Average': format_value(avg_val),
+            'Female Fencer Norm': female_norm_text
+        })
+        
+        # 最新値の規準セットごとのZスコア
+        norms = summary['norms']
+        table_data[-1].update({
+            norm_score_column(norm_set): format_value(
+                lookup_norm_score(norms, norm_set, player_name, test_type, metric, player_val)
+            )
+            for norm_set in norms['sets']
+        })
+        
+        if trends is not None:
+            trend_values = lookup_trend_values(trends, player_name, test_type, metric) or {}
+            table_data[-1].update({
+                column: format_value(trend_values.get(name)) for name, column in TREND_COLUMNS.items()
+            })
+    
+    return pd.DataFrame(table_data)
+
+@perf_traced
+def compute_team_statistics(df, config, cube=None, squads=None):
+    """全テストタイプのチーム統計（件数・平均・標準偏差・最小・最大）を集計キューブから計算"""
+    if cube is None:
+        metrics = list(dict.fromkeys(
+            metric for test_config in config.values() for metric in test_config['metrics'] if metric in df.columns
+        ))
+        cube = build_aggregate_cube(df, metrics)
+    stats = cube_team_totals(cube, squads)
+    stats = dict(zip(stats.index, stats[['count', 'mean', 'std', 'min', 'max']].itertuples(index=False)))
+    
+    team_statistics = {}
+    for test_type, test_config in config.items():
+        stats_data = []
+        for metric in test_config['metrics']:
+            metric_stats = stats.get((test_type, metric))
+            if metric_stats is not None:
+                stats_data.append({
+                    'Metric': metric,
+                    'Count': int(metric_stats.count),
+                    'Mean': f"{metric_stats.mean:.2f}",
+                    'Std Dev': f"{metric_stats.std:.2f}",
+                    'Min': format_value(metric_stats.min),
+                    'Max': format_value(metric_stats.max)
+                })
+        team_statistics[test_type] = pd.DataFrame(stats_data)
+    
+    return team_statistics
@@ -0,0 +1,29 @@
+"""Fencing Performance Test のプロセスプール用ワーカー
+
+Streamlitは再実行のたびにスクリプトを新しい __main__ モジュールとして読み込むため、
+スクリプト側で定義した関数をプールに渡すと、別セッションの再実行後にpickleできなくなる。
+ワーカーの入口は通常のモジュールであるここに置き、パイプラインはワーカープロセス内で読み込む。
+"""
+
+def read_workbook_worker(file_content):
+    """ワーカープロセスで1ファイル分のワークブックを読み込む（テストタイプ -> DataFrame）"""
+    import fencing_pipeline as pipeline
+    return pipeline.read_workbook_sheets(file_content)
+
+# 一括レポート生成用ワーカープロセスの状態
+_REPORT_WORKER_STATE = {}
+
+def init_report_worker(all_data, summary):
+    """ワーカープロセスを初期化（Aggバックエンドとデータを一度だけ設定）"""
+    import matplotlib
+    matplotlib.use('Agg')
+    _REPORT_WORKER_STATE['all_data'] = all_data
+    _REPORT_WORKER_STATE['summary'] = summary
+
+def render_report_worker(player_name, file_format, dpi, profile):
+    """ワーカープロセスで1選手分のレポートを描画し、出力データと統計を返す"""
+    import fencing_pipeline as pipeline
+    all_data = _REPORT_WORKER_STATE['all_data']
+    summary = _REPORT_WORKER_STATE['summary']
+    player_data = all_data[all_data['Name'] == player_name]
+    return pipeline.render_report(player_data, all_data, player_name, summary, file_format, dpi, profile)
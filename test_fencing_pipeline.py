@@ -0,0 +1,195 @@
+"""Fencing Performance Test のパイプラインの回帰テスト
+
+差分更新・一括計算の結果が、素朴な再計算と一致することを確認する。
+
+    python -m pytest -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import fencing_pipeline as pipeline
+
+TEST_TYPES = ['CMJ', 'IMTP', 'DJ']
+CUBE_VALUES = ['count', 'sum', 'sumsq', 'min', 'max']
+
+def make_trials(seed=0, athletes=6, sessions=10, trials=2):
+    """選手×セッション×試技の合成データ（重複処理前、値は同値にならない連続値）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.cumsum(rng.integers(2, 12, sessions)), unit='D')
+    rows = []
+    for date in dates:
+        for athlete in range(athletes):
+            for test_type in TEST_TYPES:
+                for _ in range(trials):
+                    row = {
+                        'Name': f"Athlete {athlete:02d}",
+                        'Date': date,
+                        'Type': test_type,
+                        'Sex': ['F', 'M', None][athlete % 3],
+                        'Squad': ['Foil', 'Epee'][athlete % 2]
+                    }
+                    row.update({metric: rng.uniform(10, 100) for metric in pipeline.TEST_REGISTRY[test_type]['metrics']})
+                    rows.append(row)
+    return pd.DataFrame(rows)
+
+def load_trials(raw):
+    """読み込み時と同じ順序で型付け・ハッシュ計算・重複処理を行う"""
+    typed, _ = pipeline.normalize_schema(raw.reset_index(drop=True))
+    hashes = pipeline.trial_hashes(typed)
+    df, _ = pipeline.deduplicate_trials(typed)
+    return df, hashes
+
+def canonical_rows(df, columns):
+    """行ラベル・行順・カテゴリによらず比較できる形に揃える"""
+    rows = df[columns].astype({'Name': str, 'Type': str})
+    return rows.sort_values(['Type', 'Name', 'Date'], kind='stable').reset_index(drop=True)
+
+def canonical_cube(cube):
+    """キューブを行順によらず比較できる形に揃える"""
+    cells = cube.reset_index().astype({key: str for key in pipeline.CUBE_KEYS})
+    return cells.sort_values(pipeline.CUBE_KEYS).reset_index(drop=True)
+
+def assert_cube_equal(actual, expected):
+    actual, expected = canonical_cube(actual), canonical_cube(expected)
+    pd.testing.assert_frame_equal(actual[pipeline.CUBE_KEYS], expected[pipeline.CUBE_KEYS])
+    np.testing.assert_allclose(actual[CUBE_VALUES].to_numpy(float), expected[CUBE_VALUES].to_numpy(float), rtol=1e-9)
+
+def test_ingest_matches_full_rebuild():
+    raw = make_trials()
+    cutoff = np.sort(raw['Date'].unique())[6]
+    base_raw = raw[raw['Date'] < cutoff]
+    new_raw = raw[raw['Date'] >= cutoff]
+
+    # 既存セッションの最良試技を上回る試技と、読み込み済みの試技（スキップされる）を差分に含める
+    better = base_raw.drop_duplicates(['Type', 'Name', 'Date']).head(8).copy()
+    for test_type in TEST_TYPES:
+        metric = pipeline.DEDUP_KEY_METRICS[test_type]
+        better.loc[better['Type'] == test_type, metric] += 1000
+    resent = base_raw.sample(frac=0.3, random_state=0)
+    delta_raw = pd.concat([new_raw, better, resent], ignore_index=True)
+
+    base, base_hashes = load_trials(base_raw)
+    summary = pipeline.build_summary_index(base)
+    index = pipeline.build_ingest_index(base, base_hashes)
+    updated, updated_summary, updated_index, report = pipeline.ingest_incremental(base, summary, delta_raw, index)
+
+    full, _ = load_trials(pd.concat([raw, better], ignore_index=True))
+    expected = pipeline.build_summary_index(full)
+
+    assert report['new_rows'] == len(new_raw) + len(better)
+    assert report['duplicates_skipped'] == len(resent)
+    assert report['replaced'] == len(better)
+    assert updated_index is index
+
+    # 行
+    columns = list(full.columns)
+    pd.testing.assert_frame_equal(canonical_rows(updated, columns), canonical_rows(full, columns), check_dtype=False)
+
+    # サマリー
+    assert updated_summary['metrics'] == expected['metrics']
+    assert updated_summary['athlete_types'] == expected['athlete_types']
+    assert updated_summary['athlete_entries'] == expected['athlete_entries']
+    assert set(updated_summary['team_entries']) == set(expected['team_entries'])
+    for key, entry in expected['team_entries'].items():
+        actual = updated_summary['team_entries'][key]
+        assert actual['count'] == entry['count']
+        np.testing.assert_array_equal(actual['values'], entry['values'])
+        assert actual['mean'] == pytest.approx(entry['mean'])
+
+    # キューブ
+    assert_cube_equal(updated_summary['cube'], expected['cube'])
+
+    # 規準値
+    norms, expected_norms = updated_summary['norms'], expected['norms']
+    assert norms['sets'] == expected_norms['sets']
+    assert norms['members'] == expected_norms['members']
+    np.testing.assert_array_equal(norms['count'], expected_norms['count'])
+    np.testing.assert_allclose(norms['mean'], expected_norms['mean'], rtol=1e-9)
+    np.testing.assert_allclose(norms['std'], expected_norms['std'], rtol=1e-6)
+
+    # 同じ差分の再取り込みでは何も追加しない
+    _, _, _, again = pipeline.ingest_incremental(updated, updated_summary, delta_raw, updated_index)
+    assert again['new_rows'] == 0
+    assert again['duplicates_skipped'] == len(delta_raw)
+
+def test_update_aggregate_cube_matches_rebuild():
+    df, _ = load_trials(make_trials(seed=1))
+    metrics = [metric for metric in pipeline.REGISTRY_METRICS if metric in df.columns]
+    cube = pipeline.build_aggregate_cube(df, metrics)
+
+    # 一部の行を削除し、新しい期間・チームの行を追加
+    removed = df.sample(25, random_state=1)
+    added = df.sample(15, random_state=2).copy()
+    added['Date'] += pd.Timedelta(days=400)
+    added['Squad'] = 'Sabre'
+    added.index = pd.RangeIndex(df.index.max() + 1, df.index.max() + 1 + len(added))
+    updated_df = pd.concat([df.drop(index=removed.index), added])
+
+    updated = pipeline.update_aggregate_cube(cube, updated_df, removed, added, metrics)
+    assert_cube_equal(updated, pipeline.build_aggregate_cube(updated_df, metrics))
+
+def test_roster_table_matches_comparison_table():
+    df, _ = load_trials(make_trials(seed=2))
+    config = pipeline.get_test_config()
+    summary = pipeline.build_summary_index(df, config)
+    roster = pipeline.build_roster_table(summary, config)
+
+    assert len(roster) == len(summary['athletes'])
+    for (name, test_type), rows in roster.groupby(['Name', 'Type'], sort=False):
+        table = pipeline.create_comparison_table(summary, name, list(rows['Metric']), test_type, config).set_index('Metric')
+        for row in rows.to_dict('records'):
+            expected = table.loc[row['Metric']]
+            assert pipeline.format_value(row['Latest']) == expected['Latest Value']
+            assert row['Test Date'].strftime('%Y-%m-%d') == expected['Test Date']
+            assert expected['Personal Best'].startswith(pipeline.format_value(row['Personal Best']))
+            assert pipeline.format_value(row['Team Average']) == expected['Team Average']
+        for norm_set in summary['norms']['sets']:
+            column = pipeline.norm_score_column(norm_set)
+            assert [pipeline.format_value(value) for value in rows[column]] == list(table[column])
+
+def test_lttb_indices_keeps_endpoints_and_count():
+    app = pytest.importorskip('fencing_performance_app')
+    rng = np.random.default_rng(4)
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 25) + rng.normal(0, 0.1, len(x))
+
+    for threshold in [3, 10, 400]:
+        selected = app.lttb_indices(x, y, threshold)
+        assert len(selected) == threshold
+        assert selected[0] == 0 and selected[-1] == len(x) - 1
+        assert np.all(np.diff(selected) > 0)
+
+    # 点数が閾値以下ならすべての点を残す
+    np.testing.assert_array_equal(app.lttb_indices(x[:50], y[:50], 400), np.arange(50))
+
+def test_trend_index_matches_per_group_rolling():
+    df, _ = load_trials(make_trials(seed=3))
+    trends = pipeline.build_trend_index(df)
+    metrics = [metric for metric in pipeline.REGISTRY_METRICS if metric in df.columns]
+
+    checked = 0
+    for (name, test_type), rows in df.groupby(['Name', 'Type'], observed=True):
+        for metric in pipeline.TEST_REGISTRY[test_type]['metrics']:
+            if metric not in metrics:
+                continue
+            values = rows.set_index('Date')[metric].astype(float).sort_index(kind='stable')
+            values = values[np.isfinite(values) & (values != 0)]
+            series = pipeline.trend_series(trends, name, test_type, metric)
+
+            np.testing.assert_allclose(series['acute'], values.rolling(pipeline.TREND_WINDOWS['acute']).mean(), rtol=1e-9)
+            np.testing.assert_allclose(series['chronic'], values.rolling(pipeline.TREND_WINDOWS['chronic']).mean(), rtol=1e-9)
+            np.testing.assert_allclose(
+                series['ewma'], values.ewm(halflife=pipeline.TREND_EWMA_HALFLIFE, times=values.index).mean(), rtol=1e-9
+            )
+
+            # 直近期間の最小二乗法の傾き（1週間あたり）
+            recent = values[values.index >= values.index.max() - pd.Timedelta(pipeline.TREND_WINDOWS['slope'])]
+            days = (recent.index - recent.index.min()).total_seconds() / 86400
+            slope = np.polyfit(days, recent.to_numpy(), 1)[0] * 7
+            latest = pipeline.lookup_trend_values(trends, name, test_type, metric)
+            assert latest['slope'] == pytest.approx(slope, rel=1e-6)
+            assert latest['ewma'] == pytest.approx(series['ewma'].iloc[-1])
+            checked += 1
+
+    assert checked == len(trends['spans'])